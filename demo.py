@@ -1,28 +1,31 @@
-from datetime import datetime
 from nicesheet import Sheet
 from nicesheet.specs import AnySpec, RangeSpec, DateSpec
 from nicesheet.capture import get_date, get_steps_mean
 from nicesheet.instruments import BK5492
-
-
-def build_filename(pn, sn):
-    now = datetime.now().strftime("%Y-%m-%dT%H%M%S")
-    return f"{pn.input.value}_{sn.input.value}_{now}.json"
+from nicesheet.results import ResultsStore
 
 
 meter = BK5492("DMM1")
 
-s = Sheet("ATP 1234-1 Datasheet", "v1")
+s = Sheet("ATP 1234-1 Datasheet", "v1", results=ResultsStore())
 s.instrument(meter)
 s.observe("Test operator", spec=AnySpec())
 s.observe("Test date", capture=get_date, spec=DateSpec())
 pn = s.observe("EUT part number")
 sn = s.observe("EUT serial number")
+s.identify(part_number=pn, serial_number=sn)
 s.do("(1.1) Set POWER switch to ON")
 s.observe("(1.2) Measure resistance of R1", unit="Ω", spec=RangeSpec("[5.50, 8.30]"))
 s.observe(
     "(1.3.1) Measure voltage across R1. **Do not** brush probe contacts across components.",
     capture=meter.measure_mvdc,
+    live=True,
+    unit="mV",
+    spec=RangeSpec("[0, 2]")
+)
+s.observe(
+    "(1.3.2) Measure voltage across R1 averaged over 10 readings.",
+    capture=(meter.sample, meter.measure_mvdc, {"count": 10}),
     unit="mV",
     spec=RangeSpec("[0, 2]")
 )
@@ -46,5 +49,5 @@ s.observe("(1.4.4) Calculate the mean of the three torque measurements.",
           unit="lb-in",
           spec=RangeSpec("[1.2, 1.8]"))
 
-s.filename = lambda: build_filename(pn, sn)
-s.run()
+if __name__ in {"__main__", "__mp_main__"}:
+    s.run()
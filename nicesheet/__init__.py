@@ -1,4 +1,16 @@
-import importlib.metadata
-from .sheet import Sheet
+# Submodules are imported on first use so tools that only need, say,
+# nicesheet.specs don't pay for the rest of the package
+__all__ = ["Sheet", "__version__"]
 
-__version__ = importlib.metadata.version("nicesheet")
\ No newline at end of file
+
+def __getattr__(name):
+    if name == "Sheet":
+        from .sheet import Sheet as value
+    elif name == "__version__":
+        import importlib.metadata
+        value = importlib.metadata.version("nicesheet")
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+    globals()[name] = value
+    return value
@@ -0,0 +1,143 @@
+import asyncio
+import os
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+
+def write_atomic(filename, text, fsync=True):
+    # Write to a temporary file next to the target, then rename over it so
+    # readers never see a partially written document.
+    path = Path(filename)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            if fsync:
+                os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+    if fsync and hasattr(os, "O_DIRECTORY"):
+        dir_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+
+class Autosave:
+    def __init__(self, save_fn, delay=0.5, max_delay=5):
+        self.save_fn = save_fn
+        self.delay = delay
+        self.max_delay = max_delay
+        self.pending = 0
+        self.saves = 0
+        self.errors = 0
+        self.last_latency = None
+        self.max_latency = 0
+        self.total_latency = 0
+        self._first_pending = None
+        self._timer = None
+        self._task = None
+
+    def notify(self):
+        self.pending += 1
+
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop (e.g. scripts), so just save immediately
+            self.pending = 0
+            self._save()
+            return
+
+        if self._first_pending is None:
+            self._first_pending = loop.time()
+
+        if self._task is None:
+            self._schedule(loop)
+
+    def _schedule(self, loop):
+        if self._timer is not None:
+            self._timer.cancel()
+
+        # Debounce, but never hold back a save longer than max_delay
+        deadline = min(loop.time() + self.delay, self._first_pending + self.max_delay)
+        self._timer = loop.call_at(deadline, self._start)
+
+    def _start(self):
+        self._timer = None
+        self._task = asyncio.ensure_future(self._run())
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        self.pending = 0
+        self._first_pending = None
+
+        try:
+            await loop.run_in_executor(None, self._save)
+        finally:
+            self._task = None
+
+            if self.pending:
+                self._first_pending = loop.time()
+                self._schedule(loop)
+
+    def _save(self):
+        start = time.perf_counter()
+
+        try:
+            self.save_fn()
+        except Exception:
+            self.errors += 1
+            print(traceback.format_exc())
+            return
+
+        latency = time.perf_counter() - start
+        self.saves += 1
+        self.last_latency = latency
+        self.max_latency = max(self.max_latency, latency)
+        self.total_latency += latency
+
+    async def flush(self):
+        while self._task is not None or self.pending:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if self._task is None:
+                self._start()
+
+            await self._task
+
+    def stats(self):
+        return {
+            "pending": self.pending,
+            "saving": self._task is not None,
+            "saves": self.saves,
+            "errors": self.errors,
+            "last_latency": self.last_latency,
+            "mean_latency": self.total_latency / self.saves if self.saves else None,
+            "max_latency": self.max_latency,
+        }
+
+    def summary(self):
+        stats = self.stats()
+
+        if stats["last_latency"] is None:
+            latency = "n/a"
+        else:
+            latency = (f"{stats['last_latency'] * 1000:.1f} ms last, "
+                       f"{stats['mean_latency'] * 1000:.1f} ms mean, "
+                       f"{stats['max_latency'] * 1000:.1f} ms max")
+
+        return (f"Autosave: {stats['saves']} saves, {stats['errors']} errors\n"
+                f"Pending changes: {stats['pending']}\n"
+                f"Save latency: {latency}")
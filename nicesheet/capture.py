@@ -1,5 +1,7 @@
+from inspect import iscoroutinefunction
 from statistics import mean
 from datetime import date
+from .model import StepData
 
 
 def capture_def_parts(capture_def):
@@ -22,6 +24,48 @@ def capture_def_parts(capture_def):
     return capture_fn, args, kwargs
 
 
+def step_refs(value):
+    # Steps passed anywhere in a capture's arguments, e.g. the steps given
+    # to get_steps_mean
+    if isinstance(value, StepData):
+        yield value
+    elif isinstance(value, (list, tuple, set)):
+        for item in value:
+            yield from step_refs(item)
+    elif isinstance(value, dict):
+        for item in value.values():
+            yield from step_refs(item)
+
+
+def remap_steps(value, steps):
+    # Swaps steps in a capture's arguments for the steps at the same index
+    # in another copy of the sheet
+    if isinstance(value, StepData):
+        return steps[value.index]
+    elif isinstance(value, (list, tuple, set)):
+        return type(value)(remap_steps(item, steps) for item in value)
+    elif isinstance(value, dict):
+        return {key: remap_steps(item, steps) for key, item in value.items()}
+    else:
+        return value
+
+
+def capture_dependencies(capture_def):
+    _, args, kwargs = capture_def_parts(capture_def)
+    return {step.index for step in step_refs([args, kwargs])}
+
+
+def derived_from(capture_def):
+    # Steps whose values a plain function like get_steps_mean is computed
+    # from. Async captures talk to instruments, so they're never derived.
+    capture_fn, _, _ = capture_def_parts(capture_def)
+
+    if iscoroutinefunction(capture_fn):
+        return set()
+
+    return capture_dependencies(capture_def)
+
+
 def run_capture(capture_def):
     capture_fn, args, kwargs = capture_def_parts(capture_def)
     return capture_fn(*args, **kwargs)
@@ -37,5 +81,14 @@ def get_date():
 
 
 def get_steps_mean(steps):
-    values = [float(step.input.value) for step in steps]
+    values = [float(step.value) for step in steps]
     return f"{mean(values):.3f}"
+
+
+async def run_any_capture(capture_def):
+    capture_fn, args, kwargs = capture_def_parts(capture_def)
+
+    if iscoroutinefunction(capture_fn):
+        return await capture_fn(*args, **kwargs)
+    else:
+        return capture_fn(*args, **kwargs)
@@ -0,0 +1,272 @@
+import argparse
+import csv
+import json
+import os
+import sys
+from contextlib import closing
+from itertools import groupby, islice
+from pathlib import Path
+from .model import ObservationStepData
+from .results import ResultsStore
+from .revalidate import load_sheet, result_files
+
+
+META_COLUMNS = ["file", "title", "version", "part_number", "serial_number", "finished"]
+
+
+def ref_column(ref, occurrence):
+    # Refs can repeat within a sheet, so the second step with a ref gets
+    # the column "ref#2" and so on
+    return ref if occurrence == 1 else f"{ref}#{occurrence}"
+
+
+def ref_columns(refs):
+    seen = {}
+
+    for ref in refs:
+        seen[ref] = seen.get(ref, 0) + 1
+        yield ref_column(ref, seen[ref])
+
+
+def result_row(filename, result):
+    row = {
+        "file": filename,
+        "title": result.get("title"),
+        "version": result.get("version"),
+        "part_number": result.get("part_number"),
+        "serial_number": result.get("serial_number"),
+        "finished": result.get("last-edit"),
+    }
+
+    steps = [step for step in result.get("steps", []) if step.get("ref") is not None]
+
+    for column, step in zip(ref_columns(step["ref"] for step in steps), steps):
+        if "input" in step:
+            row[column] = step["input"]
+
+    return row
+
+
+def file_records(paths, after=0):
+    # Yields (mtime, row) for result files modified after the given time
+    for path in paths:
+        mtime = os.path.getmtime(path)
+
+        if mtime <= after:
+            continue
+
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"{path}: {e}", file=sys.stderr)
+            continue
+
+        yield mtime, result_row(str(path), result)
+
+
+def index_records(store, after=0):
+    # Yields (sheet id, row) for indexed sheets added after the given id
+    query = ("SELECT sheets.id, sheets.filename, sheets.title, sheets.version, "
+             "sheets.part_number, sheets.serial_number, sheets.finished, "
+             "steps.ref, steps.value "
+             "FROM sheets LEFT JOIN steps ON steps.sheet_id = sheets.id "
+             "WHERE sheets.id > ? ORDER BY sheets.id, steps.position")
+
+    with closing(store.connect()) as connection:
+        for sheet_id, rows in groupby(connection.execute(query, (after,)), key=lambda r: r["id"]):
+            row = None
+            seen = {}
+
+            for r in rows:
+                if row is None:
+                    row = {
+                        "file": r["filename"],
+                        "title": r["title"],
+                        "version": r["version"],
+                        "part_number": r["part_number"],
+                        "serial_number": r["serial_number"],
+                        "finished": r["finished"],
+                    }
+
+                if r["ref"] is None:
+                    continue
+
+                seen[r["ref"]] = seen.get(r["ref"], 0) + 1
+
+                if r["value"] is not None:
+                    row[ref_column(r["ref"], seen[r["ref"]])] = r["value"]
+
+            yield sheet_id, row
+
+
+def index_refs(store):
+    with closing(store.connect()) as connection:
+        rows = connection.execute(
+            "SELECT ref, occurrence FROM ("
+            "  SELECT ref, position, ROW_NUMBER() OVER ("
+            "    PARTITION BY sheet_id, ref ORDER BY position) AS occurrence"
+            "  FROM steps WHERE ref IS NOT NULL) "
+            "GROUP BY ref, occurrence ORDER BY MIN(position), ref, occurrence"
+        )
+        return [ref_column(row["ref"], row["occurrence"]) for row in rows]
+
+
+def spool(records, path):
+    # Reading result files is the slow part, so when the columns aren't
+    # known up front each file is read once, its row kept in a spool file
+    # while the columns are collected, and the rows read back from there.
+    # Returns the spooled records and the columns seen.
+    refs = {}
+
+    with open(path, "w", encoding="utf-8") as f:
+        for key, row in records:
+            for column in row:
+                if column not in META_COLUMNS:
+                    refs.setdefault(column, None)
+
+            f.write(json.dumps([key, row]) + "\n")
+
+    def read():
+        try:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    key, row = json.loads(line)
+                    yield key, row
+        finally:
+            path.unlink(missing_ok=True)
+
+    return read(), list(refs)
+
+
+class CSVWriter:
+    def __init__(self, path, columns):
+        self.file = open(path, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.file, columns, extrasaction="ignore")
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, columns):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise RuntimeError("Parquet export requires pyarrow to be installed")
+
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([(column, pyarrow.string()) for column in columns])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        table = self.pyarrow.Table.from_pylist(rows, schema=self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {
+    "csv": CSVWriter,
+    "parquet": ParquetWriter,
+}
+
+
+def export(output, fmt="csv", paths=None, store=None, refs=None,
+           incremental=True, batch_size=1000):
+    # Each run writes a new part file to the output directory holding only
+    # results newer than the previous run, so memory use is bounded by
+    # batch_size and earlier results are never re-read.
+    output = Path(output)
+    output.mkdir(parents=True, exist_ok=True)
+    state_file = output / ".export-state.json"
+
+    if incremental and state_file.exists():
+        state = json.loads(state_file.read_text())
+    else:
+        state = {"after": 0, "part": 0}
+
+        for part in output.glob("part-*"):
+            part.unlink()
+
+    if store is not None:
+        records = index_records(store, state["after"])
+        refs = refs if refs is not None else index_refs(store)
+    else:
+        records = file_records(paths, state["after"])
+
+        if refs is None:
+            records, refs = spool(records, output / ".export-spool.jsonl")
+
+    columns = META_COLUMNS + [ref for ref in refs if ref not in META_COLUMNS]
+    part = output / f"part-{state['part'] + 1:05d}.{fmt}"
+    writer = None
+    count = 0
+
+    try:
+        while batch := list(islice(records, batch_size)):
+            if writer is None:
+                writer = WRITERS[fmt](part, columns)
+
+            writer.write([row for _, row in batch])
+            state["after"] = max(state["after"], max(key for key, _ in batch))
+            count += len(batch)
+    finally:
+        records.close()
+
+        if writer is not None:
+            writer.close()
+
+    if writer is None:
+        return 0, None
+
+    state["part"] += 1
+    state_file.write_text(json.dumps(state))
+    return count, part
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Export results to CSV or Parquet with one column per step ref"
+    )
+    parser.add_argument("output", help="directory for exported part files")
+    parser.add_argument("results", nargs="*", default=["data/*.json"],
+                        help="result files or glob patterns (default: data/*.json)")
+    parser.add_argument("--index", help="export from a results index instead of files")
+    parser.add_argument("--format", choices=list(WRITERS), default="csv")
+    parser.add_argument("--sheet", help="take step refs from this sheet definition")
+    parser.add_argument("--refs", help="comma separated step refs to export")
+    parser.add_argument("--full", action="store_true",
+                        help="re-export everything instead of only new results")
+    args = parser.parse_args(argv)
+
+    if args.refs:
+        refs = args.refs.split(",")
+    elif args.sheet:
+        sheet = load_sheet(args.sheet)
+        steps = [step for step in sheet.steps if step.ref]
+        refs = [
+            column for column, step in zip(ref_columns(step.ref for step in steps), steps)
+            if isinstance(step, ObservationStepData)
+        ]
+    else:
+        refs = None
+
+    store = ResultsStore(args.index) if args.index else None
+    paths = None if store else result_files(args.results)
+    count, part = export(args.output, args.format, paths, store, refs, not args.full)
+
+    if part is None:
+        print("No new results")
+    else:
+        print(f"Exported {count} results to {part}")
+
+
+if __name__ == "__main__":
+    main()
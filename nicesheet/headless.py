@@ -0,0 +1,136 @@
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from .model import ObservationStepData
+from .schedule import capture_all, record_failure
+from .system_info import get_system_info
+
+
+def load_saved_settings(sheet):
+    # Port and baud settings saved from the UI live in NiceGUI's general
+    # storage file. Read it directly so NiceGUI doesn't need importing.
+    path = Path(os.environ.get("NICEGUI_STORAGE_PATH", ".nicegui")) / "storage-general.json"
+
+    try:
+        saved = json.loads(path.read_text(encoding="utf-8")).get("instruments", {})
+    except (OSError, ValueError):
+        return
+
+    for instrument in sheet.instruments:
+        if instrument.port is None and instrument.name in saved:
+            instrument.configure(**saved[instrument.name])
+
+
+def step_input(inputs, step):
+    for key in (step, step.ref, step.procedure):
+        if key is not None and key in inputs:
+            return inputs[key]
+
+    return None
+
+
+async def run_steps(sheet, inputs):
+    captured = []
+
+    for step in sheet.steps:
+        value = step_input(inputs, step)
+
+        if not isinstance(step, ObservationStepData):
+            if value is not None:
+                sheet.set_field(step.index, "compliance", value)
+        elif value is not None:
+            sheet.set_field(step.index, "input", str(value))
+            sheet.set_field(step.index, "compliance", step.verdict())
+        elif step.capture is not None:
+            sheet.set_field(step.index, "note", "")
+            captured.append(step)
+
+    errors = await capture_all(sheet, captured)
+
+    for index, error in errors.items():
+        record_failure(sheet, sheet.steps[index], error)
+
+    return errors
+
+
+async def run_headless(sheet, inputs=None, filename=None):
+    # Runs a sheet without the UI: every capture is run, specs are checked
+    # and the result is saved in the same format as Print does.
+    # Steps without a capture take their value from inputs, keyed by the
+    # step itself, its ref or its procedure text.
+    sheet.system_info = get_system_info()
+    sheet.started = datetime.now().isoformat()
+    # Only the result file is written, not the session state
+    sheet.save_state = False
+
+    await run_steps(sheet, inputs or {})
+    filename = await sheet.save_result(filename)
+    compliance = [step.compliance for step in sheet.steps]
+
+    return {
+        "filename": str(filename),
+        "passed": compliance.count("Pass"),
+        "failed": compliance.count("Fail"),
+        "incomplete": compliance.count(None),
+    }
+
+
+def input_pair(text):
+    ref, sep, value = text.partition("=")
+
+    if not sep:
+        raise argparse.ArgumentTypeError(f"expected REF=VALUE, got {text!r}")
+
+    return ref, value
+
+
+async def cycle(sheet, inputs, count):
+    results = []
+
+    for unit in range(count):
+        if unit > 0:
+            sheet.reset()
+
+        start = time.perf_counter()
+        result = await run_headless(sheet, inputs)
+        result["seconds"] = time.perf_counter() - start
+        results.append(result)
+
+        print(f"{result['filename']}: {result['passed']} passed, {result['failed']} failed, "
+              f"{result['incomplete']} incomplete ({result['seconds']:.2f} s)")
+
+    return results
+
+
+def main(argv=None):
+    from .revalidate import load_sheet
+
+    parser = argparse.ArgumentParser(
+        description="Run a sheet's captures without the UI and save the results"
+    )
+    parser.add_argument("sheet", help="sheet definition, e.g. atp.py or atp.py:sheet")
+    parser.add_argument("-i", "--input", type=input_pair, action="append", default=[],
+                        metavar="REF=VALUE",
+                        help="value for a step without a capture, by ref or procedure text")
+    parser.add_argument("-n", "--count", type=int, default=1,
+                        help="number of units to run back to back")
+    args = parser.parse_args(argv)
+
+    sheet = load_sheet(args.sheet)
+    load_saved_settings(sheet)
+
+    if any(instrument.port is None for instrument in sheet.instruments):
+        from .instruments.discovery import auto_bind
+        asyncio.run(auto_bind(sheet.instruments))
+
+    results = asyncio.run(cycle(sheet, dict(args.input), args.count))
+    return 1 if any(result["failed"] for result in results) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
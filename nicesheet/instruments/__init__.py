@@ -1 +1,2 @@
-from .bk5492 import BK5492
\ No newline at end of file
+from .bk5492 import BK5492
+from .broker import BrokerInstrument
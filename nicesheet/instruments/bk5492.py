@@ -1,11 +1,15 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from enum import Enum
 import time
 import asyncio
 from decimal import Decimal
-from .instrument import Instrument, InstrumentException, NoResponse, PortSelector
-from nicegui import ui, app
-import serial
+from serial import SerialException
+from .instrument import Instrument, InstrumentException, NoResponse, BadResponse
+from .policy import ExchangePolicy
+
+
+class SettleTimeout(InstrumentException):
+    pass
 
 
 class DisplayMode(Enum):
@@ -70,18 +74,56 @@ def decode_r0(response):
     return info
 
 
+def valid_response(cmd, response):
+    # The meter sometimes answers with a bare ">" or an empty line
+    if response in ("", ">"):
+        return False
+
+    if cmd == "R0":
+        return len(response) in (8, 10)
+
+    return True
+
+
+def is_settled(readings, count, rel_tol, abs_tol):
+    if len(readings) < count:
+        return False
+
+    recent = readings[-count:]
+    spread = max(recent) - min(recent)
+    return spread <= max(abs_tol, rel_tol * max(abs(r) for r in recent))
+
+
 class BK5492(Instrument):
-    def __init__(self, name, verbose=False):
+    def __init__(self, name, port=None, baud=9600, verbose=False, pipeline=False, policy=None):
         self.name = name
         self.device_model = "BK5492"
-        self.port = None
-        self.baud = 9600
-        self.timeout = 0.1
+        self.port = port
+        self.baud = baud
+        self.policy = policy if policy is not None else ExchangePolicy()
         self.verbose = verbose
         self.change_delay = 5
-        self.prep_storage()
+        self.state = None
+        self.state_port = None
+        self.state_time = 0
+        # Without pipelining the function is only confirmed once the cached
+        # state is this old, so a front panel change is noticed within it
+        self.state_ttl = 2
+        self.settle_interval = 0.2
+        self.settle_count = 3
+        self.settle_rel_tol = Decimal("0.001")
+        self.settle_abs_tol = Decimal("0.0005")
+        self.last_settle_time = None
+        self.last_settle_timed_out = False
+        # Pipelining is opt-in: the manual doesn't say whether the meter
+        # buffers commands that arrive before it has answered the last one
+        self.pipeline = pipeline
+        self.version_cache = {}
 
     def build_ui_options(self):
+        from nicegui import ui, app
+        from .widgets import PortSelector
+
         with ui.row():
             PortSelector(label="Port") \
                 .bind_value(self, "port") \
@@ -93,7 +135,7 @@ class BK5492(Instrument):
 
     def test_connection(self):
         try:
-            firmware = self.firmware
+            firmware = self.read_version(refresh=True).split(",")[0]
             return (f"Successfully connected to BK5492\n"
                     f"Port: {self.port}\n"
                     f"Baud: {self.baud}\n"
@@ -101,81 +143,287 @@ class BK5492(Instrument):
         except Exception as e:
             return e
 
-    def send_cmd(self, cmd):
-        with serial.Serial(self.port, self.baud, timeout=self.timeout) as ser:
-            tx = cmd.encode("ascii") + b"\r\n"
+    def probe(self, port):
+        # Ports that aren't a meter shouldn't hold up the search, so ask
+        # once with a short timeout
+        meter = BK5492("probe", port=port, baud=self.baud,
+                       policy=ExchangePolicy(timeout=0.2, retries=0))
 
-            # todo Use logging
-            if self.verbose:
-                print(">", tx)
-
-            ser.write(tx)
-            ser.flush()
-            time.sleep(0.05) # This seems to reduce the odds of bad results?
+        try:
+            return {"model": meter.model, "firmware": meter.firmware}
+        except (InstrumentException, NoResponse, SerialException, OSError,
+                KeyError, IndexError):
+            return None
+
+    def send_cmd_sync(self, cmd):
+        return self.connection().transact(
+            self.baud, self.policy.timeout,
+            lambda ser: self.exchange(ser, cmd),
+            lambda: self.telemetry.retry(cmd)
+        )
+
+    def send_cmds_sync(self, cmds):
+        # With pipelining the commands go out in one write and the replies
+        # are read back in order, so they cost one round trip instead of
+        # one each. Without it they still share one hold of the port.
+        if self.pipeline:
+            exchange = lambda ser: self.exchange_many(ser, cmds)
+        else:
+            exchange = lambda ser: [self.exchange(ser, cmd) for cmd in cmds]
+
+        def on_retry():
+            for cmd in cmds:
+                self.telemetry.retry(cmd)
+
+        return self.connection().transact(self.baud, self.policy.timeout, exchange, on_retry)
+
+    async def send_cmds(self, cmds):
+        return await asyncio.to_thread(self.send_cmds_sync, cmds)
+
+    def exchange(self, ser, cmd):
+        return self.exchange_many(ser, [cmd])[0]
+
+    def exchange_many(self, ser, cmds):
+        # Bad or missing replies are retried after a growing pause. The
+        # whole batch is resent, since later replies can't be trusted to
+        # line up once one has gone wrong.
+        attempt = 0
+
+        while True:
+            try:
+                return self.exchange_once(ser, cmds)
+            except (NoResponse, BadResponse):
+                if attempt >= self.policy.retries:
+                    raise
+
+            time.sleep(self.policy.backoff_delay(attempt))
+            attempt += 1
+
+            for cmd in cmds:
+                self.telemetry.retry(cmd)
+
+    def exchange_once(self, ser, cmds):
+        tx = b"".join(cmd.encode("ascii") + b"\r\n" for cmd in cmds)
+
+        # todo Use logging
+        if self.verbose:
+            print(">", tx)
+
+        # Drop anything left over from an earlier exchange that timed out
+        ser.reset_input_buffer()
+        start = last = time.perf_counter()
+        ser.write(tx)
+        ser.flush()
+        responses = []
+
+        for cmd in cmds:
+            ser.timeout = self.policy.timeout
             rx = ser.read_until(b"\r\n")
-            
+            now = time.perf_counter()
+
             if self.verbose:
                 print("<", rx)
 
-            # # Not sure why, but sometimes the BK5492 gives bad responses
-            # bad_responses = [b"\r\n", b">\r\n"]
+            if not rx.endswith(b"\r\n"):
+                self.policy.timed_out()
+                error = NoResponse(f"No response from BK5492 at {self.port}")
+                self.telemetry.error(cmd, error)
+                raise error
 
-            # if rx in bad_responses:
-            #     print(">", tx)
-            #     ser.write(tx)
-            #     time.sleep(0.1)
-            #     rx = ser.read_until(b"\r\n")
-            #     print("<", rx)
+            # Replies are learnt from the gap since the one before, but
+            # recorded from the write, so pipelined commands show when
+            # their reply actually arrived
+            self.policy.observe(now - last)
+            last = now
+            self.telemetry.record(cmd, now - start, len(cmd) + 2, len(rx))
+            response = rx.strip().decode("ascii", "replace")
 
-            if rx == b"":
-                raise NoResponse(f"No response from BK5492 at {self.port}")
+            if not valid_response(cmd, response):
+                error = BadResponse(f"BK5492 bad response to {cmd}: {rx!r}")
+                self.telemetry.error(cmd, error)
+                raise error
 
-            return rx.strip().decode()
-    
-    async def change_to_vdc(self):
-        response = self.send_cmd("R0")
-        response = decode_r0(response)
-    
-        if response.function1 != Function.Vdc:
-            self.send_cmd("S100S")
-            await asyncio.sleep(self.change_delay)
+            responses.append(response)
 
+        return responses
 
-    async def change_to_vac(self):
-        response = self.send_cmd("R0")
-        response = decode_r0(response)
-    
-        if response.function1 != Function.Vac:
-            self.send_cmd("S110S")
-            await asyncio.sleep(self.change_delay)
+    def state_valid(self):
+        # The front panel can be changed by hand, so only trust the cached
+        # state for a short time.
+        expired = time.monotonic() - self.state_time > self.state_ttl
+        return self.state is not None and self.state_port == self.port and not expired
 
+    def set_state(self, response):
+        try:
+            self.state = decode_r0(response)
+        except Exception as e:
+            self.telemetry.error("R0", e)
+            self.invalidate_state()
+            raise
+
+        self.state_port = self.port
+        self.state_time = time.monotonic()
+        return self.state
+
+    async def read_state(self):
+        if not self.state_valid():
+            try:
+                response = await self.send_cmd("R0")
+            except Exception:
+                self.invalidate_state()
+                raise
+
+            self.set_state(response)
+
+        return self.state
+
+    def invalidate_state(self):
+        self.state = None
+
+    async def change_function(self, function, cmd):
+        state = await self.read_state()
+
+        if state.function1 == function:
+            return
+
+        try:
+            await self.send_cmd(cmd)
+        except Exception:
+            self.invalidate_state()
+            raise
+
+        self.state = replace(state, function1=function)
+        self.state_time = time.monotonic()
+        return await self.wait_for_settle()
+
+    async def wait_for_settle(self):
+        # Poll readings after a function change until they stop moving,
+        # falling back to change_delay if they never do. Returns the
+        # settled reading, or None if there isn't one. A meter that never
+        # settles is flagged and counted as a SettleTimeout error, as the
+        # reading taken next may still be moving.
+        start = time.monotonic()
+        readings = []
+        settled = False
+
+        while time.monotonic() - start < self.change_delay:
+            await asyncio.sleep(self.settle_interval)
+
+            try:
+                readings.append(self.decode_reading(await self.send_cmd("R1")))
+            except (InstrumentException, NoResponse, ArithmeticError):
+                # Readings are often garbled while the meter is switching
+                readings.clear()
+                continue
+
+            if is_settled(readings, self.settle_count, self.settle_rel_tol, self.settle_abs_tol):
+                settled = True
+                break
+
+        elapsed = time.monotonic() - start
+        self.last_settle_time = elapsed
+        self.last_settle_timed_out = not settled
+
+        if not settled:
+            self.telemetry.error("R1", SettleTimeout(
+                f"{self.name} readings didn't settle within {self.change_delay} s"
+            ))
+
+        if self.verbose:
+            print(f"{self.name} {'settled' if settled else 'did not settle'} in {elapsed:.2f} s")
+
+        return readings[-1] if settled else None
+
+    def decode_reading(self, response):
+        try:
+            return Decimal(response)
+        except ArithmeticError as e:
+            self.telemetry.error("R1", e)
+            raise
+
+    async def fetch_value(self):
+        try:
+            return self.decode_reading(await self.send_cmd("R1"))
+        except Exception:
+            self.invalidate_state()
+            raise
+
+    # The public methods below hold the meter's lock, since the cached
+    # state and function changes must not interleave between callers.
+    # The methods they use don't take it again.
+
+    async def read_value(self):
+        async with self.lock():
+            return await self.fetch_value()
+
+    async def change_to_vdc(self):
+        async with self.lock():
+            await self.change_function(Function.Vdc, "S100S")
+
+    async def change_to_vac(self):
+        async with self.lock():
+            await self.change_function(Function.Vac, "S110S")
+
+    async def measure(self, function, cmd):
+        async with self.lock():
+            return await self.take_reading(function, cmd)
+
+    async def take_reading(self, function, cmd):
+        if self.pipeline or not self.state_valid():
+            # Ask for the state and a reading together. The reading is only
+            # kept if the meter turns out to be on the right function. When
+            # pipelined this costs no extra round trip, so the function is
+            # confirmed with every reading rather than trusted from cache.
+            try:
+                r0, r1 = await self.send_cmds(["R0", "R1"])
+            except Exception:
+                self.invalidate_state()
+                raise
+
+            if self.set_state(r0).function1 == function:
+                try:
+                    return self.decode_reading(r1)
+                except ArithmeticError:
+                    # A garbled reading, so take another one below
+                    pass
+
+        settled = await self.change_function(function, cmd)
+
+        if settled is not None:
+            return settled
+
+        return await self.fetch_value()
 
     async def measure_vdc(self):
-        await self.change_to_vdc()
-        response = self.send_cmd("R1")
-        return Decimal(response)
+        return await self.measure(Function.Vdc, "S100S")
 
     async def measure_mvdc(self):
         measurement = await self.measure_vdc()
         return measurement * Decimal("1000")
     
     async def measure_vac(self):
-        await self.change_to_vac()
-        response = self.send_cmd("R1")
-        return Decimal(response)
+        return await self.measure(Function.Vac, "S110S")
 
     async def measure_mvac(self):
         measurement = await self.measure_vac()
         return measurement * Decimal("1000")
 
+    def read_version(self, refresh=False):
+        # RV never changes for a given meter, so it is only asked once per
+        # port
+        if refresh or self.port not in self.version_cache:
+            self.version_cache[self.port] = self.send_cmd_sync("RV")
+
+        return self.version_cache[self.port]
+
     @property
     def firmware(self):
-        result = self.send_cmd("RV")
+        result = self.read_version()
         return result.split(",")[0]
 
     @property
     def model(self):
-        result = self.send_cmd("RV")
+        result = self.read_version()
         return {
             "5": "BK5491",
             "6": "BK5492",
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import itertools
+import json
+import socket
+import sys
+import time
+import types
+from decimal import Decimal
+from inspect import iscoroutinefunction
+from .instrument import Instrument, InstrumentException, NoResponse, BadResponse
+
+
+# A broker owns the serial ports of a bench's instruments and takes
+# requests for them from any number of sheets and scripts. Requests and
+# replies are single lines of JSON over a localhost TCP socket:
+#
+#   {"id": 1, "instrument": "DMM1", "method": "measure_vdc", "args": [], "priority": 0}
+#   {"id": 1, "result": {"decimal": "1.5"}}
+#   {"id": 1, "error": {"type": "NoResponse", "message": "..."}}
+
+DEFAULT_ADDRESS = ("127.0.0.1", 5492)
+
+ERRORS = {
+    "InstrumentException": InstrumentException,
+    "NoResponse": NoResponse,
+    "BadResponse": BadResponse,
+}
+
+# Only measurements and read-only queries go through the broker, so a
+# client can't reconfigure or write raw commands to a shared instrument
+ALLOWED = {"model", "firmware", "read_version", "test_connection"}
+
+
+def allowed(method):
+    return method.startswith("measure_") or method in ALLOWED
+
+
+def encode(message):
+    def default(o):
+        if isinstance(o, Decimal):
+            return {"decimal": str(o)}
+        raise TypeError(f"{type(o).__name__} can't be sent to or from the broker")
+
+    return json.dumps(message, default=default).encode() + b"\n"
+
+
+def decode(line):
+    def object_hook(o):
+        return Decimal(o["decimal"]) if o.keys() == {"decimal"} else o
+
+    return json.loads(line, object_hook=object_hook)
+
+
+def error_reply(id, e):
+    return {"id": id, "error": {"type": type(e).__name__, "message": str(e)}}
+
+
+def raise_error(error):
+    cls = ERRORS.get(error["type"])
+
+    if cls is None:
+        raise InstrumentException(f"{error['type']}: {error['message']}")
+
+    raise cls(error["message"])
+
+
+class Broker:
+    # Each instrument has a queue worked through one request at a time,
+    # lowest priority number first and in arrival order within a priority
+    def __init__(self, instruments, host=DEFAULT_ADDRESS[0], port=DEFAULT_ADDRESS[1]):
+        self.instruments = {instrument.name: instrument for instrument in instruments}
+        self.host = host
+        self.port = port
+        self.queues = {}
+        self.workers = []
+        self.order = itertools.count()
+        self.server = None
+        self.clients = set()
+
+    async def start(self):
+        for name, instrument in self.instruments.items():
+            self.queues[name] = asyncio.PriorityQueue()
+            self.workers.append(asyncio.create_task(self.work(instrument, self.queues[name])))
+
+        self.server = await asyncio.start_server(self.handle_client, self.host, self.port)
+        return self.server.sockets[0].getsockname()[:2]
+
+    async def close(self):
+        self.server.close()
+
+        for writer in list(self.clients):
+            writer.close()
+
+        await self.server.wait_closed()
+
+        for worker in self.workers:
+            worker.cancel()
+
+    async def work(self, instrument, queue):
+        while True:
+            _, _, method, args, future = await queue.get()
+
+            if future.cancelled():
+                continue
+
+            try:
+                future.set_result(await self.call(instrument, method, args))
+            except Exception as e:
+                future.set_exception(e)
+
+    async def call(self, instrument, method, args):
+        if not allowed(method):
+            raise InstrumentException(f"{method} can't be called through the broker")
+
+        # Properties like model may talk to the instrument too
+        attr = await asyncio.to_thread(getattr, instrument, method)
+
+        if iscoroutinefunction(attr):
+            return await attr(*args)
+        elif callable(attr):
+            return await asyncio.to_thread(attr, *args)
+        else:
+            return attr
+
+    def submit(self, name, method, args=(), priority=0):
+        try:
+            queue = self.queues[name]
+        except KeyError:
+            raise InstrumentException(f"The broker has no instrument {name!r}")
+
+        future = asyncio.get_running_loop().create_future()
+        queue.put_nowait((priority, next(self.order), method, list(args), future))
+        return future
+
+    async def handle_client(self, reader, writer):
+        lock = asyncio.Lock()
+        tasks = set()
+        self.clients.add(writer)
+
+        async def answer(request):
+            try:
+                result = await self.submit(
+                    request["instrument"], request["method"],
+                    request.get("args", []), request.get("priority", 0)
+                )
+                reply = encode({"id": request["id"], "result": result})
+            except Exception as e:
+                reply = encode(error_reply(request.get("id"), e))
+
+            try:
+                async with lock:
+                    writer.write(reply)
+                    await writer.drain()
+            except ConnectionError:
+                # The client gave up waiting
+                pass
+
+        try:
+            while line := await reader.readline():
+                try:
+                    request = decode(line)
+                except ValueError as e:
+                    writer.write(encode(error_reply(None, e)))
+                    continue
+
+                # Replies go back as they finish, tagged with the request id
+                task = asyncio.create_task(answer(request))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.discard(writer)
+            writer.close()
+
+
+class BrokerInstrument(Instrument):
+    # Stands in for an instrument owned by a broker, with the same API,
+    # e.g. BrokerInstrument("DMM1").measure_vdc(). Each call is a short
+    # lived connection, so proxies work from any thread or event loop.
+    def __init__(self, name, model="BK5492", address=DEFAULT_ADDRESS, priority=0, timeout=30):
+        self.name = name
+        self.device_model = model
+        self.address = tuple(address)
+        self.port = f"broker://{self.address[0]}:{self.address[1]}"
+        self.priority = priority
+        self.timeout = timeout
+        self.ids = itertools.count(1)
+
+    def request(self, method, args):
+        return {
+            "id": next(self.ids),
+            "instrument": self.name,
+            "method": method,
+            "args": list(args),
+            "priority": self.priority,
+        }
+
+    def result(self, method, tx, rx, start):
+        self.telemetry.record(method, time.perf_counter() - start, len(tx), len(rx))
+
+        if not rx:
+            error = NoResponse(f"No response from broker at {self.port}")
+            self.telemetry.error(method, error)
+            raise error
+
+        reply = decode(rx)
+
+        if "error" in reply:
+            try:
+                raise_error(reply["error"])
+            except Exception as e:
+                self.telemetry.error(method, e)
+                raise
+
+        return reply["result"]
+
+    async def call(self, method, *args):
+        tx = encode(self.request(method, args))
+        start = time.perf_counter()
+
+        try:
+            reader, writer = await asyncio.open_connection(*self.address)
+        except OSError as e:
+            raise NoResponse(f"No broker at {self.port}: {e}")
+
+        try:
+            writer.write(tx)
+            await writer.drain()
+            rx = await asyncio.wait_for(reader.readline(), self.timeout)
+        finally:
+            writer.close()
+
+        return self.result(method, tx, rx, start)
+
+    def call_sync(self, method, *args):
+        tx = encode(self.request(method, args))
+        start = time.perf_counter()
+
+        try:
+            sock = socket.create_connection(self.address, self.timeout)
+        except OSError as e:
+            raise NoResponse(f"No broker at {self.port}: {e}")
+
+        with sock, sock.makefile("rb") as f:
+            sock.sendall(tx)
+            rx = f.readline()
+
+        return self.result(method, tx, rx, start)
+
+    def __getattr__(self, name):
+        # Allowed methods, such as measure_vdc, become calls to the broker
+        if not allowed(name):
+            raise AttributeError(f"{type(self).__name__!r} object has no attribute {name!r}")
+
+        async def remote(self, *args):
+            return await self.call(name, *args)
+
+        return types.MethodType(remote, self)
+
+    @property
+    def model(self):
+        return self.call_sync("model")
+
+    @property
+    def firmware(self):
+        return self.call_sync("firmware")
+
+    def configure(self, port=None, baud=None, **kwargs):
+        # The broker has the port settings
+        pass
+
+    def build_ui_options(self):
+        from nicegui import ui
+
+        ui.label(f"Shared through the broker at {self.address[0]}:{self.address[1]}")
+
+    def test_connection(self):
+        try:
+            return (f"Successfully connected to {self.model} through the broker\n"
+                    f"Broker: {self.address[0]}:{self.address[1]}\n"
+                    f"Firmware: {self.firmware}")
+        except Exception as e:
+            return e
+
+
+def instrument_spec(text):
+    name, sep, port = text.partition("=")
+
+    if not sep or not name or not port:
+        raise argparse.ArgumentTypeError(f"expected NAME=PORT, got {text!r}")
+
+    return name, port
+
+
+async def serve(instruments, host, port):
+    broker = Broker(instruments, host, port)
+    host, port = await broker.start()
+    print(f"Broker listening on {host}:{port}", flush=True)
+
+    async with broker.server:
+        await broker.server.serve_forever()
+
+
+def main(argv=None):
+    from .bk5492 import BK5492
+
+    parser = argparse.ArgumentParser(
+        description="Share bench instruments between sheets and scripts"
+    )
+    parser.add_argument("instruments", type=instrument_spec, nargs="+", metavar="NAME=PORT",
+                        help="BK5492 meter to share, e.g. DMM1=/dev/ttyUSB0")
+    parser.add_argument("--host", default=DEFAULT_ADDRESS[0])
+    parser.add_argument("--port", type=int, default=DEFAULT_ADDRESS[1])
+    parser.add_argument("--baud", type=int, default=9600)
+    args = parser.parse_args(argv)
+
+    instruments = [BK5492(name, port=port, baud=args.baud) for name, port in args.instruments]
+
+    try:
+        asyncio.run(serve(instruments, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
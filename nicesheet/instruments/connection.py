@@ -0,0 +1,73 @@
+import threading
+import serial
+
+
+# Lets ports like bk5492://dmm1 open a simulated meter
+if "nicesheet.instruments.urlhandler" not in serial.protocol_handler_packages:
+    serial.protocol_handler_packages.append("nicesheet.instruments.urlhandler")
+
+
+class Connection:
+    def __init__(self, port):
+        self.port = port
+        self.lock = threading.RLock()
+        self.serial = None
+        self.opens = 0
+
+    def open(self, baud, timeout):
+        if self.serial is None or not self.serial.is_open:
+            self.serial = serial.serial_for_url(self.port, baud, timeout=timeout)
+            self.opens += 1
+        else:
+            if self.serial.baudrate != baud:
+                self.serial.baudrate = baud
+            if self.serial.timeout != timeout:
+                self.serial.timeout = timeout
+
+        return self.serial
+
+    def close(self):
+        if self.serial is not None:
+            try:
+                self.serial.close()
+            except (serial.SerialException, OSError):
+                pass
+            self.serial = None
+
+    def transact(self, baud, timeout, fn, on_retry=None):
+        with self.lock:
+            try:
+                return fn(self.open(baud, timeout))
+            except (serial.SerialException, OSError):
+                # The port went away (e.g. a USB adapter was replugged), so
+                # reopen it and give the exchange one more try.
+                self.close()
+
+                if on_retry is not None:
+                    on_retry()
+
+                return fn(self.open(baud, timeout))
+
+
+class ConnectionPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.connections = {}
+
+    def get(self, port):
+        with self.lock:
+            try:
+                return self.connections[port]
+            except KeyError:
+                connection = Connection(port)
+                self.connections[port] = connection
+                return connection
+
+    def close_all(self):
+        with self.lock:
+            for connection in self.connections.values():
+                with connection.lock:
+                    connection.close()
+
+
+connections = ConnectionPool()
@@ -0,0 +1,155 @@
+import asyncio
+import threading
+from serial.tools import list_ports
+from .connection import connections
+from .instrument import Instrument
+
+
+def scan_ports():
+    ports = sorted(list_ports.comports(), key=lambda p: p.device)
+    return {p.device: p.description for p in ports}
+
+
+class PortWatcher:
+    # Keeps the serial port list up to date in the background, since
+    # scanning is slow on machines with many USB serial adapters. Listeners
+    # are awaited with the added and removed ports whenever they change.
+    def __init__(self, interval=2):
+        self.interval = interval
+        self.ports = None
+        self.version = 0
+        self.listeners = []
+        self.task = None
+        self.lock = threading.Lock()
+
+    def current(self):
+        if self.ports is None:
+            self.update(scan_ports())
+
+        return self.ports
+
+    def update(self, ports):
+        with self.lock:
+            old = self.ports or {}
+
+            if ports == self.ports:
+                return None
+
+            self.ports = ports
+            self.version += 1
+
+        return set(ports) - set(old), set(old) - set(ports)
+
+    async def scan(self):
+        change = self.update(await asyncio.to_thread(scan_ports))
+
+        if change is None:
+            return
+
+        for listener in list(self.listeners):
+            try:
+                await listener(*change)
+            except Exception as e:
+                # todo Use logging
+                print(f"Port watcher listener failed: {e!r}")
+
+    async def run(self):
+        while True:
+            await self.scan()
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self.run())
+
+        return self.task
+
+    def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+
+watcher = PortWatcher()
+
+
+def needs_port(instrument, ports):
+    # URL ports like bk5492:// never show up in a scan, so only plain
+    # devices that have gone missing count as unbound
+    if instrument.port is None:
+        return True
+
+    return "://" not in instrument.port and instrument.port not in ports
+
+
+def probe_port(instrument, port):
+    connection = connections.get(port)
+    was_open = connection.serial is not None
+
+    try:
+        return instrument.probe(port)
+    finally:
+        # Don't keep ports open that turned out to be something else
+        if not was_open:
+            with connection.lock:
+                connection.close()
+
+
+async def auto_bind(instruments, ports=None):
+    # Probe the free ports all at once and give each instrument without a
+    # working port the first one that answers as its model. Returns the
+    # identity found for each instrument that was bound.
+    if ports is None:
+        ports = await asyncio.to_thread(scan_ports)
+
+    unbound = [
+        i for i in instruments
+        if needs_port(i, ports) and type(i).probe is not Instrument.probe
+    ]
+    taken = {i.port for i in instruments if i not in unbound}
+    groups = {}
+    bound = {}
+
+    for instrument in unbound:
+        groups.setdefault(type(instrument), []).append(instrument)
+
+    for group in groups.values():
+        free = [port for port in ports if port not in taken]
+        identities = await asyncio.gather(*(
+            asyncio.to_thread(probe_port, group[0], port) for port in free
+        ))
+
+        for port, identity in zip(free, identities):
+            if identity is None:
+                continue
+
+            for instrument in group:
+                if instrument not in bound and instrument.matches(identity):
+                    instrument.port = port
+                    bound[instrument] = identity
+                    taken.add(port)
+                    break
+
+    return bound
+
+
+def start_discovery(instruments, on_bound=None):
+    # Bind instruments now, and again whenever a port is plugged in. One
+    # round of probing at a time, so a port can't be given out twice.
+    lock = asyncio.Lock()
+
+    async def bind():
+        async with lock:
+            ports = await asyncio.to_thread(watcher.current)
+
+            for instrument, identity in (await auto_bind(instruments, ports)).items():
+                if on_bound is not None:
+                    on_bound(instrument, identity)
+
+    async def ports_changed(added, removed):
+        if added:
+            await bind()
+
+    watcher.listeners.append(ports_changed)
+    watcher.start()
+    return asyncio.create_task(bind())
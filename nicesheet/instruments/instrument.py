@@ -1,5 +1,10 @@
-from serial.tools import list_ports
-from nicegui import ui, app
+import asyncio
+import time
+import weakref
+from inspect import iscoroutinefunction
+from .connection import connections
+from .telemetry import Telemetry
+from ..stats import SampleSet
 
 
 class Instrument:
@@ -7,44 +12,159 @@ class Instrument:
     def model(self):
         raise NotImplementedError
 
+    def connection(self):
+        return connections.get(self.port)
+
+    @property
+    def telemetry(self):
+        # Created on first use, since subclasses don't call up to __init__
+        try:
+            return self._telemetry
+        except AttributeError:
+            return self.__dict__.setdefault("_telemetry", Telemetry())
+
+    def lock(self):
+        # Held across a whole measurement so that multi-command sequences
+        # from captures, live readings and other sessions don't interleave.
+        # Locks belong to an event loop, so there is one per loop.
+        try:
+            locks = self._locks
+        except AttributeError:
+            locks = self.__dict__.setdefault("_locks", weakref.WeakKeyDictionary())
+
+        loop = asyncio.get_running_loop()
+
+        try:
+            return locks[loop]
+        except KeyError:
+            return locks.setdefault(loop, InstrumentLock())
+
+    def send_cmd_sync(self, cmd):
+        raise NotImplementedError
+
+    async def send_cmd(self, cmd):
+        # Serial I/O blocks, so keep it off the event loop
+        return await asyncio.to_thread(self.send_cmd_sync, cmd)
+
+    async def sample(self, measure, count=10, duration=None):
+        # Take count readings, or as many as fit in duration seconds. The
+        # lock is held throughout so other captures can't switch the
+        # instrument's function between samples.
+        samples = SampleSet()
+
+        async with self.lock():
+            start = time.monotonic()
+
+            while True:
+                samples.add(await measure())
+
+                if duration is not None:
+                    if time.monotonic() - start >= duration:
+                        break
+                elif samples.count >= count:
+                    break
+
+        return samples
+
+    @property
+    def sync(self):
+        return SyncProxy(self)
+
+    def configure(self, port=None, baud=None, **kwargs):
+        if port is not None:
+            self.port = port
+
+        if baud is not None:
+            self.baud = baud
+
     def to_ui(self):
+        from nicegui import ui
+
+        self.prep_storage()
+
+        # Each client gets its own copy of these elements, so the handler
+        # is given the ones it should update
         with ui.expansion() as expansion:
-            self.config_expansion = expansion
             with expansion.add_slot("header"):
                 with ui.row().classes('w-full max-w-screen-lg items-center'):
-                    self.test_button = ui.button(icon="help_center")
-                    self.test_button.on("click.stop", self.handle_test_connection)
+                    test_button = ui.button(icon="help_center")
+                    test_button.on(
+                        "click.stop",
+                        lambda: self.handle_test_connection(test_button, expansion)
+                    )
                     ui.label(f"{self.name} ({self.device_model})")
 
             expansion.classes('w-full')
-            self.test_button.props("flat")
+            test_button.props("flat")
 
             self.build_ui_options()
+            self.build_telemetry_ui()
 
     def build_ui_options(self):
         raise NotImplementedError
 
-    def handle_test_connection(self):
-        result = self.test_connection()
+    def build_telemetry_ui(self):
+        from nicegui import ui
+
+        columns = [
+            {"name": "command", "label": "Command", "field": "command", "align": "left"},
+            {"name": "count", "label": "Count", "field": "count"},
+            {"name": "mean", "label": "Mean (ms)", "field": "mean"},
+            {"name": "max", "label": "Max (ms)", "field": "max"},
+            {"name": "bytes", "label": "Bytes out / in", "field": "bytes"},
+            {"name": "retries", "label": "Retries", "field": "retries"},
+            {"name": "errors", "label": "Errors", "field": "errors", "align": "left"},
+            {"name": "histogram", "label": "Round trips", "field": "histogram", "align": "left"},
+        ]
+        table = ui.table(columns=columns, rows=self.telemetry.rows(), row_key="command")
+        table.props("dense flat").classes("w-full")
+
+        def update():
+            rows = self.telemetry.rows()
+
+            if rows != table.rows:
+                table.rows = rows
+                table.update()
+
+        ui.timer(2, update)
+
+    async def handle_test_connection(self, test_button, expansion):
+        from nicegui import ui
+
+        test_button.props("loading")
+        result = await asyncio.to_thread(self.test_connection)
+        test_button.props(remove="loading")
 
         if isinstance(result, Exception):
             color = "negative"
             msg = "Connection failed!\n" + repr(result)
-            self.config_expansion.run_method("show")
+            expansion.run_method("show")
             icon = "link_off"
         else:
             color = "positive"
             msg = result
-            self.config_expansion.run_method("hide")
+            expansion.run_method("hide")
             icon = "link"
         
-        self.test_button.props(f"color={color} icon={icon}")
+        test_button.props(f"color={color} icon={icon}")
         ui.notify(msg, type=color, multi_line=True, classes="multi-line-notification")
 
     def test_connection(self):
         raise NotImplementedError
 
+    def probe(self, port):
+        # Identify whatever is on port, returning e.g. {"model": ...,
+        # "firmware": ...}, or None if it isn't this kind of instrument.
+        # Instruments that can't tell leave this alone and are never
+        # bound automatically.
+        raise NotImplementedError
+
+    def matches(self, identity):
+        return identity.get("model") == self.device_model
+
     def prep_storage(self):
+        from nicegui import app
+
         if "instruments" not in app.storage.general:
             app.storage.general["instruments"] = {}
 
@@ -55,6 +175,50 @@ class Instrument:
             app.storage.general["instruments"][self.name] = record
 
 
+class SyncProxy:
+    # Blocking access to an instrument's async API for use from scripts,
+    # e.g. meter.sync.measure_vdc()
+    def __init__(self, instrument):
+        self.instrument = instrument
+
+    def __getattr__(self, name):
+        attr = getattr(self.instrument, name)
+
+        if not iscoroutinefunction(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            return asyncio.run(attr(*args, **kwargs))
+
+        return call
+
+
+class InstrumentLock:
+    # An asyncio.Lock that the task holding it can take again, so locked
+    # measurements can be made inside a longer locked sequence like
+    # sample()
+    def __init__(self):
+        self._lock = asyncio.Lock()
+        self.owner = None
+        self.depth = 0
+
+    async def __aenter__(self):
+        task = asyncio.current_task()
+
+        if self.owner is not task:
+            await self._lock.acquire()
+            self.owner = task
+
+        self.depth += 1
+
+    async def __aexit__(self, *exc_info):
+        self.depth -= 1
+
+        if self.depth == 0:
+            self.owner = None
+            self._lock.release()
+
+
 class InstrumentException(Exception):
     pass
 
@@ -63,16 +227,5 @@ class NoResponse(Exception):
     pass
 
 
-class PortSelector(ui.select):
-    def __init__(self, **kwargs):
-        ports = list_ports.comports()
-        ports_map = {p.device: f"{p.device}: {p.description}" for p in ports}
-        device = ports[0].device if len(ports) > 0 else None
-
-        super().__init__(ports_map, value=device, **kwargs)
-        self.on("click", self.update_options)
-    
-    def update_options(self):
-        ports = list_ports.comports()
-        ports_map = {p.device: f"{p.device}: {p.description}" for p in ports}
-        self.set_options(ports_map)
\ No newline at end of file
+class BadResponse(InstrumentException):
+    pass
@@ -0,0 +1,49 @@
+import threading
+
+
+class ExchangePolicy:
+    # How long to wait for a reply and how often to retry. The timeout
+    # follows the reply times actually seen from the device, smoothed the
+    # way TCP estimates its retransmission timeout, so a quick meter isn't
+    # held to a slow fixed wait. timeout is used until there are replies
+    # to learn from, and again after a reply goes missing.
+    def __init__(self, timeout=0.25, min_timeout=0.05, max_timeout=2.0,
+                 retries=2, backoff=0.05, max_backoff=0.5, margin=4):
+        self.initial_timeout = timeout
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.margin = margin
+        self.srtt = None
+        self.rttvar = None
+        self.lock = threading.Lock()
+
+    @property
+    def timeout(self):
+        with self.lock:
+            if self.srtt is None:
+                return self.initial_timeout
+
+            timeout = self.srtt + self.margin * self.rttvar
+            return min(self.max_timeout, max(self.min_timeout, timeout))
+
+    def observe(self, seconds):
+        with self.lock:
+            if self.srtt is None:
+                self.srtt = seconds
+                self.rttvar = seconds / 2
+            else:
+                self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - seconds)
+                self.srtt = 0.875 * self.srtt + 0.125 * seconds
+
+    def timed_out(self):
+        # The device may have changed or be busy, so start learning again
+        # from the conservative timeout
+        with self.lock:
+            self.srtt = None
+            self.rttvar = None
+
+    def backoff_delay(self, attempt):
+        return min(self.max_backoff, self.backoff * 2 ** attempt)
@@ -0,0 +1,211 @@
+import random
+import threading
+import time
+from collections import deque
+from urllib.parse import urlsplit, parse_qs
+from serial.serialutil import SerialBase, SerialException, PortNotOpenError, to_bytes
+from .bk5492 import Function
+
+
+# Reply lines for each fault, None being no reply at all
+FAULTS = {
+    "silent": None,
+    "blank": b"\r\n",
+    "bad": b">\r\n",
+}
+
+
+class BK5492Simulator:
+    # Answers BK5492 commands the way the meter does, with knobs for how
+    # slow, noisy and unreliable it is. Used through the bk5492:// serial
+    # URL, e.g. BK5492("DMM1", port="bk5492://dmm1?latency=0.02&noise=0.001")
+    def __init__(self, latency=0.02, noise=0.0, switch_delay=0.0, fault_rate=0.0,
+                 faults=("silent", "blank", "bad"), seed=None, vdc=1.0, vac=0.5, link_delay=0.0):
+        self.latency = latency
+        self.link_delay = link_delay
+        self.noise = noise
+        self.switch_delay = switch_delay
+        self.fault_rate = fault_rate
+        self.faults = list(faults)
+        self.random = random.Random(seed)
+        self.values = {Function.Vdc: vdc, Function.Vac: vac}
+        self.function = Function.Vdc
+        self.switched = 0
+        self.firmware = "1.02"
+        self.commands = []
+        self.lock = threading.Lock()
+
+    def configure(self, options):
+        for name, value in options.items():
+            if name == "faults":
+                self.faults = value.split(",")
+
+                for fault in self.faults:
+                    if fault not in FAULTS:
+                        raise ValueError(f"unknown fault: {fault!r}")
+            elif name == "seed":
+                self.random.seed(int(value))
+            elif name in {"latency", "link_delay", "noise", "switch_delay", "fault_rate"}:
+                setattr(self, name, float(value))
+            elif name in {"vdc", "vac"}:
+                self.values[Function[name.capitalize()]] = float(value)
+            else:
+                raise ValueError(f"unknown option: {name!r}")
+
+    def respond(self, cmd):
+        # Returns the reply line, or None if the meter stays silent
+        with self.lock:
+            self.commands.append(cmd)
+
+            if self.fault_rate and self.random.random() < self.fault_rate:
+                return FAULTS[self.random.choice(self.faults)]
+
+            return self.reply(cmd).encode("ascii") + b"\r\n"
+
+    def reply(self, cmd):
+        if cmd == "R0":
+            return f"00001S{self.function.value}0"
+        elif cmd == "R1":
+            return self.reading()
+        elif cmd == "RV":
+            return f"{self.firmware},6"
+        elif len(cmd) == 5 and cmd[0] == "S" and cmd[4] == "S":
+            self.function = Function(int(cmd[2]))
+            self.switched = time.monotonic()
+            return "=>"
+        else:
+            return "?"
+
+    def reading(self):
+        value = self.values.get(self.function, 0.0)
+        noise = self.noise
+
+        if time.monotonic() - self.switched < self.switch_delay:
+            # Readings wander while the meter changes range
+            noise = max(abs(value), 1.0)
+
+        return f"{value + self.random.gauss(0, noise) if noise else value:.5f}"
+
+
+simulators = {}
+
+
+def simulator(url):
+    # Simulators are kept by URL so reopening the port finds the same meter
+    parts = urlsplit(url)
+    key = parts.netloc
+
+    if key not in simulators:
+        simulators[key] = BK5492Simulator()
+
+    options = {name: values[-1] for name, values in parse_qs(parts.query).items()}
+    simulators[key].configure(options)
+    return simulators[key]
+
+
+class SimulatedSerial(SerialBase):
+    # A pyserial port connected to a BK5492Simulator. Replies become
+    # readable latency seconds after their command is written, one after
+    # another for commands written together. link_delay is added once per
+    # write, like the latency timer of a USB serial adapter.
+    def open(self):
+        if self._port is None:
+            raise SerialException("Port must be configured before it can be used.")
+
+        if self.is_open:
+            raise SerialException("Port is already open.")
+
+        try:
+            self.device = simulator(self._port)
+        except ValueError as e:
+            raise SerialException(f"bad simulator URL {self._port!r}: {e}")
+
+        self.received = bytearray()
+        self.pending = deque()
+        self.line = bytearray()
+        self.is_open = True
+
+    def close(self):
+        self.is_open = False
+
+    def _reconfigure_port(self, *args, **kwargs):
+        pass
+
+    def _update_rts_state(self):
+        pass
+
+    def _update_dtr_state(self):
+        pass
+
+    def _update_break_state(self):
+        pass
+
+    def arrive(self):
+        now = time.monotonic()
+
+        while self.pending and self.pending[0][0] <= now:
+            self.received += self.pending.popleft()[1]
+
+    @property
+    def in_waiting(self):
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        self.arrive()
+        return len(self.received)
+
+    def write(self, data):
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        data = to_bytes(data)
+        self.line += data
+        ready = max(time.monotonic() + self.device.link_delay,
+                    self.pending[-1][0] if self.pending else 0)
+
+        while b"\r\n" in self.line:
+            cmd, _, rest = bytes(self.line).partition(b"\r\n")
+            self.line = bytearray(rest)
+            reply = self.device.respond(cmd.decode("ascii", "replace"))
+            ready += self.device.latency
+
+            if reply is not None:
+                self.pending.append((ready, reply))
+
+        return len(data)
+
+    def read(self, size=1):
+        if not self.is_open:
+            raise PortNotOpenError()
+
+        deadline = None if self._timeout is None else time.monotonic() + self._timeout
+
+        while True:
+            self.arrive()
+
+            if len(self.received) >= size:
+                break
+
+            now = time.monotonic()
+            wake = self.pending[0][0] if self.pending else None
+
+            if deadline is not None and now >= deadline:
+                break
+
+            if wake is None and deadline is None:
+                # Nothing will ever arrive
+                break
+
+            time.sleep(max(0, min(x for x in (wake, deadline) if x is not None) - now))
+
+        data = bytes(self.received[:size])
+        del self.received[:size]
+        return data
+
+    def reset_input_buffer(self):
+        # Replies still on their way aren't affected, as with a real port
+        self.arrive()
+        self.received.clear()
+
+    def reset_output_buffer(self):
+        pass
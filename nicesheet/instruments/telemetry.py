@@ -0,0 +1,109 @@
+import bisect
+import threading
+from datetime import datetime
+
+
+# Upper bounds of the round trip time histogram buckets, in seconds. The
+# last bucket holds everything slower.
+BUCKETS = (0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2)
+
+
+def bucket_label(i):
+    if i == len(BUCKETS):
+        return f">{BUCKETS[-1] * 1000:g}ms"
+    return f"≤{BUCKETS[i] * 1000:g}ms"
+
+
+class CommandStats:
+    __slots__ = ("count", "total", "max", "sent", "received", "retries", "errors", "histogram")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.max = 0
+        self.sent = 0
+        self.received = 0
+        self.retries = 0
+        self.errors = {}
+        self.histogram = [0] * (len(BUCKETS) + 1)
+
+    def add(self, seconds, sent, received):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.sent += sent
+        self.received += received
+        self.histogram[bisect.bisect_left(BUCKETS, seconds)] += 1
+
+    @property
+    def mean(self):
+        return self.total / self.count if self.count else None
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "mean_ms": round(self.mean * 1000, 3) if self.count else None,
+            "max_ms": round(self.max * 1000, 3),
+            "bytes_sent": self.sent,
+            "bytes_received": self.received,
+            "retries": self.retries,
+            "errors": dict(self.errors),
+            "histogram": {
+                bucket_label(i): n for i, n in enumerate(self.histogram) if n
+            },
+        }
+
+
+class Telemetry:
+    # Round trip times, traffic, retries and errors for each command sent
+    # to an instrument. Commands are sent from worker threads, hence the
+    # lock.
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.commands = {}
+        self.since = datetime.now().isoformat()
+
+    def stats(self, cmd):
+        try:
+            return self.commands[cmd]
+        except KeyError:
+            return self.commands.setdefault(cmd, CommandStats())
+
+    def record(self, cmd, seconds, sent, received):
+        with self.lock:
+            self.stats(cmd).add(seconds, sent, received)
+
+    def retry(self, cmd):
+        with self.lock:
+            self.stats(cmd).retries += 1
+
+    def error(self, cmd, exception):
+        name = type(exception).__name__
+
+        with self.lock:
+            errors = self.stats(cmd).errors
+            errors[name] = errors.get(name, 0) + 1
+
+    def to_json(self):
+        with self.lock:
+            return {
+                "since": self.since,
+                "commands": {cmd: stats.to_json() for cmd, stats in self.commands.items()},
+            }
+
+    def rows(self):
+        rows = []
+
+        for cmd, stats in self.to_json()["commands"].items():
+            rows.append({
+                "command": cmd,
+                "count": stats["count"],
+                "mean": stats["mean_ms"],
+                "max": stats["max_ms"],
+                "bytes": f"{stats['bytes_sent']} / {stats['bytes_received']}",
+                "retries": stats["retries"],
+                "errors": ", ".join(f"{k}: {v}" for k, v in stats["errors"].items()),
+                "histogram": "  ".join(f"{k}: {v}" for k, v in stats["histogram"].items()),
+            })
+
+        return rows
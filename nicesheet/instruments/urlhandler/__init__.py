@@ -0,0 +1,2 @@
+# pyserial URL handlers, found by serial_for_url() through
+# serial.protocol_handler_packages (see connection.py)
@@ -0,0 +1,2 @@
+# bk5492://<name>?latency=...&noise=...&switch_delay=...&fault_rate=...
+from ..simulator import SimulatedSerial as Serial
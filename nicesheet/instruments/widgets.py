@@ -0,0 +1,29 @@
+from nicegui import ui
+from .discovery import watcher
+
+
+def port_options(ports, value=None):
+    options = {device: f"{device}: {description}" for device, description in ports.items()}
+
+    # Keep ports that aren't plugged in right now, or are URLs, selectable
+    if value is not None and value not in options:
+        options[value] = value
+
+    return options
+
+
+class PortSelector(ui.select):
+    # Options come from the background port watcher rather than scanning
+    # here, and follow it as adapters are plugged in and out
+    def __init__(self, **kwargs):
+        ports = watcher.current()
+        device = next(iter(ports), None)
+
+        super().__init__(port_options(ports), value=device, **kwargs)
+        self.version = watcher.version
+        ui.timer(1, self.update_options)
+
+    def update_options(self):
+        if self.version != watcher.version:
+            self.version = watcher.version
+            self.set_options(port_options(watcher.ports, self.value), value=self.value)
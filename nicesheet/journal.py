@@ -0,0 +1,157 @@
+import json
+import os
+from pathlib import Path
+
+
+STEP_FIELDS = ("input", "compliance", "note")
+
+
+def sheet_header(title, version, steps):
+    # What a journal or snapshot was written for, so state left over from
+    # another sheet or version isn't applied to the wrong steps
+    return {
+        "title": title,
+        "version": version,
+        "steps": [[step.ref, step.procedure] for step in steps],
+    }
+
+
+def index_map(source, target):
+    # Maps step indexes in the sheet described by the source header to
+    # those of the target. Steps are matched on ref and procedure when the
+    # sheets differ, and steps that can't be matched one to one are dropped.
+    if source is None or source.get("title") != target["title"]:
+        return {}
+
+    source_steps = [tuple(step) for step in source.get("steps", [])]
+    target_steps = [tuple(step) for step in target["steps"]]
+
+    if source_steps == target_steps:
+        return {index: index for index in range(len(target_steps))}
+
+    def unique(steps):
+        indexes = {}
+
+        for index, step in enumerate(steps):
+            indexes.setdefault(step, []).append(index)
+
+        return {step: found[0] for step, found in indexes.items() if len(found) == 1}
+
+    target_indexes = unique(target_steps)
+    return {
+        index: target_indexes[step]
+        for step, index in unique(source_steps).items() if step in target_indexes
+    }
+
+
+class Journal:
+    # header is called for the sheet_header() written at the top of each
+    # journal file. Records from files written for another sheet are
+    # mapped to this one's steps, or dropped.
+    def __init__(self, filename, fsync=False, header=None):
+        self.path = Path(filename)
+        self.rotated_path = self.path.with_name(self.path.name + ".old")
+        self.fsync = fsync
+        self.header = header
+        self.records = 0
+        self._file = None
+
+    def append(self, index, field, value):
+        if self._file is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+            if self.header is not None and self._file.tell() == 0:
+                self._file.write(json.dumps(self.header()) + "\n")
+
+        self._file.write(json.dumps([index, field, value]) + "\n")
+        self._file.flush()
+
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+        self.records += 1
+
+    @property
+    def rotated(self):
+        return self.rotated_path.exists()
+
+    def rotate(self):
+        # Move the live journal aside so it can be dropped once a snapshot
+        # covering its records has been written.
+        self.close()
+
+        if self.path.exists():
+            os.replace(self.path, self.rotated_path)
+
+        self.records = 0
+
+    def discard_rotated(self):
+        self.rotated_path.unlink(missing_ok=True)
+
+    def clear(self):
+        self.rotate()
+        self.discard_rotated()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def replay(self):
+        header = self.header() if self.header is not None else None
+
+        for path in [self.rotated_path, self.path]:
+            if not path.exists():
+                continue
+
+            with open(path, encoding="utf-8") as f:
+                indexes = None
+
+                if header is not None:
+                    try:
+                        indexes = index_map(json.loads(f.readline()), header)
+                    except (ValueError, AttributeError):
+                        # Written without a header, so its sheet is unknown
+                        continue
+
+                for line in f:
+                    try:
+                        index, field, value = json.loads(line)
+                    except ValueError:
+                        # A torn final record from an interrupted write
+                        break
+
+                    if indexes is None:
+                        yield index, field, value
+                    elif index in indexes:
+                        yield indexes[index], field, value
+
+
+def load_state(snapshot_filename, journal, header):
+    # Step fields by index in the sheet described by header, from the
+    # snapshot and then the journal
+    state = {}
+
+    try:
+        with open(snapshot_filename, encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (FileNotFoundError, ValueError):
+        snapshot = None
+
+    if isinstance(snapshot, dict):
+        steps = snapshot.get("steps", [])
+        source = dict(snapshot, steps=[[step.get("ref"), step.get("procedure")] for step in steps])
+
+        for source_index, index in index_map(source, header).items():
+            step = steps[source_index]
+            state[index] = {k: step[k] for k in STEP_FIELDS if k in step}
+
+    if journal is None:
+        return state
+
+    for index, field, value in journal.replay():
+        if field in STEP_FIELDS:
+            state.setdefault(index, {})[field] = value
+
+    return state
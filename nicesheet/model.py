@@ -0,0 +1,72 @@
+FIELD_ATTRS = {
+    "input": "value",
+    "compliance": "compliance",
+    "note": "note",
+}
+
+
+class StepData:
+    # Steps are plain records so large sheets stay small in memory. UI for a
+    # step is only built when it is shown.
+    __slots__ = ("index", "ref", "procedure", "compliance", "note")
+
+    def __init__(self, index, ref, procedure):
+        self.index = index
+        self.ref = ref
+        self.procedure = procedure
+        self.compliance = None
+        self.note = ""
+
+    def update(self, field, value):
+        attr = FIELD_ATTRS[field]
+
+        if getattr(self, attr) == value:
+            return False
+
+        setattr(self, attr, value)
+        return True
+
+    def restore(self, fields):
+        for field, value in fields.items():
+            if field in FIELD_ATTRS and hasattr(self, FIELD_ATTRS[field]):
+                self.update(field, value)
+
+
+class SimpleStepData(StepData):
+    __slots__ = ()
+
+
+class ObservationStepData(StepData):
+    __slots__ = ("value", "samples", "unit", "capture", "spec", "min_decimal_places", "options")
+
+    def __init__(self, index, ref, procedure, unit=None, capture=None, spec=None,
+                 min_decimal_places=None, **options):
+        super().__init__(index, ref, procedure)
+        self.value = ""
+        self.samples = None
+        self.unit = unit
+        self.capture = capture
+        self.spec = spec
+        self.min_decimal_places = min_decimal_places
+        self.options = options or None
+
+    def option(self, name, default=None):
+        if self.options is None:
+            return default
+        return self.options.get(name, default)
+
+    def verdict(self):
+        if self.spec is None:
+            return "Pass" if self.value != "" else None
+
+        return "Pass" if self.spec.complies(self.value) else "Fail"
+
+    def update(self, field, value):
+        if not super().update(field, value):
+            return False
+
+        if field == "input" and self.samples is not None and value != self.samples.value:
+            # Edited by hand, so the samples no longer back the value
+            self.samples = None
+
+        return True
@@ -0,0 +1,71 @@
+// Moves the cursor between steps in the browser, so arrow and enter keys
+// don't wait on a round trip to the server. Step rows carry their index
+// in data-step; the server hears about the new step from the row's
+// focusin event, and is only asked to move the cursor when the step is on
+// another page.
+(() => {
+  function stepRows() {
+    const rows = new Map();
+
+    for (const row of document.querySelectorAll("[data-step]")) {
+      rows.set(Number(row.dataset.step), row);
+    }
+
+    return rows;
+  }
+
+  function cursorTarget(row) {
+    return row.querySelector("input, textarea") || row.querySelector(".q-btn-toggle button");
+  }
+
+  function goto(index) {
+    if (index < 0) return;
+
+    const row = stepRows().get(index);
+
+    if (row === undefined) {
+      emitEvent("nicesheet_goto", index);
+    } else {
+      cursorTarget(row)?.focus();
+    }
+  }
+
+  // Same rule as ObservationStep.warn_decimal_places, which shows the
+  // warning
+  function hasEnoughPlaces(field) {
+    const places = field.closest("[data-min-places]")?.dataset.minPlaces;
+
+    if (places === undefined || field.value === "") return true;
+
+    const parts = field.value.split(".");
+    return parts.length >= 2 && parts[1].length >= Number(places);
+  }
+
+  document.addEventListener("keydown", (event) => {
+    const row = event.target.closest?.("[data-step]");
+
+    if (!row) return;
+
+    const index = Number(row.dataset.step);
+    const toggle = event.target.closest(".q-btn-toggle");
+    const field = event.target.matches("input, textarea") ? event.target : null;
+
+    if (event.key === "ArrowDown") {
+      goto(index + 1);
+    } else if (event.key === "ArrowUp") {
+      goto(index - 1);
+    } else if (toggle && event.key === "ArrowLeft") {
+      toggle.firstElementChild.focus();
+    } else if (toggle && event.key === "ArrowRight") {
+      toggle.lastElementChild.focus();
+    } else if (field && event.key === "Enter" && event.shiftKey) {
+      goto(index - 1);
+    } else if (field && event.key === "Enter" && !event.ctrlKey && hasEnoughPlaces(field)) {
+      goto(index + 1);
+    } else {
+      return;
+    }
+
+    event.preventDefault();
+  });
+})();
@@ -0,0 +1,299 @@
+from pathlib import Path
+from nicegui import ui, app, Client
+from .step import SimpleStep, ObservationStep
+from .model import SimpleStepData, ObservationStepData
+from .schedule import capture_all
+from .session import Sessions
+from .instruments.discovery import start_discovery
+
+
+package_directory = Path(__file__).parent
+
+
+VIEWS = {
+    SimpleStepData: SimpleStep,
+    ObservationStepData: ObservationStep,
+}
+
+
+def serve(sheet):
+    # Every browser gets its own session of the sheet, so several stations
+    # can share one server
+    sessions = Sessions(sheet, sheet.state_dir / "sessions",
+                        sheet.settings.get("session_memory", 64 * 2**20))
+    sheet.sessions = sessions
+    # Read once and shared by every client's page
+    ui.add_head_html("<style>" + (package_directory / "style.css").read_text() + "</style>",
+                     shared=True)
+    ui.add_head_html("<script>" + (package_directory / "navigation.js").read_text() + "</script>",
+                     shared=True)
+
+    if sheet.instruments:
+        app.on_startup(lambda: start_discovery(sheet.instruments, remember_port))
+
+    @ui.page("/")
+    async def index():
+        session = await sessions.get(app.storage.browser["id"])
+        SheetPage(session).build()
+
+    ui.run(title=sheet.title, favicon=package_directory / "assets/favicon.ico",
+           storage_secret=sheet.settings.get("storage_secret") or sessions.secret())
+
+
+def remember_port(instrument, identity):
+    # Save ports found by discovery as if they had been picked in the UI
+    instrument.prep_storage()
+    record = app.storage.general["instruments"][instrument.name]
+    record["port"] = instrument.port
+    record["identity"] = identity
+
+
+class SheetPage:
+    # The NiceGUI interface for one session of a sheet. The sheet itself
+    # holds the steps and results and can run without this, see
+    # Sheet.run_headless().
+    def __init__(self, sheet):
+        self.sheet = sheet
+        self.client = None
+        self.steps = sheet.steps
+        self.page_size = sheet.page_size
+        self.current_step = 0
+        self.page = None
+        self.views = {}
+        self.pagination = None
+        self.handlers = {
+            "advance": self.on_advance,
+            "got_focus": self.focus_step,
+            "changed": sheet.on_changed,
+            "set": self.set_field,
+            "clicked": self.on_click_step,
+        }
+
+    def dispatch(self, index, event, *args):
+        # All step views report events here, tagged with their step index
+        return self.handlers[event](index, *args)
+
+    @property
+    def closed(self):
+        return self.client is None or self.client.id not in Client.instances
+
+    def build(self):
+        sheet = self.sheet
+        self.client = ui.context.client
+
+        if sheet.page is not None and not sheet.page.closed:
+            sheet.page.detach()
+
+        sheet.page = self
+        self.dark_mode = ui.dark_mode()
+        self.add_note_requested = False
+
+        with ui.header().props("reveal").classes("items-center"):
+            with ui.row().classes("col items-baseline"):
+                ui.label(sheet.title).classes("text-h6")
+                with ui.label(sheet.version):
+                    ui.tooltip(self.version_info()).classes("multi-line-notification")
+            self.save_status().classes("print-hide")
+            self.add_note().props("flat color=white dense").classes("print-hide")
+            self.color_choice().props("flat color=white dense").classes("print-hide")
+
+            if any(getattr(step, "capture", None) for step in sheet.steps):
+                self.capture_all_button = ui.button(
+                    "Capture all", icon="auto_fix_high", on_click=self.capture_all
+                ).props("flat color=white dense").classes("print-hide")
+
+            ui.button("Print", icon="print", on_click=self.finish) \
+                .props("flat color=white dense") \
+                .classes("print-hide")
+            ui.button("Reset", icon="delete", on_click=sheet.reset) \
+                .props("flat color=white dense") \
+                .classes("print-hide")
+
+        for instrument in sheet.instruments:
+            instrument.to_ui()
+
+        with ui.row().classes("max-w-screen-lg items-center fit row no-wrap"):
+            ui.label("Ref").classes("col-1 text-h6")
+            ui.label("Procedure").classes("col text-h6")
+            ui.label("Specification").classes("col-2 text-h6")
+            ui.label("Observation").classes("col-3 text-h6")
+            ui.label("Result").classes("col-1 text-h6")
+
+        self.current_step = 0
+
+        if self.page_size is not None:
+            self.pagination = ui.pagination(
+                1, self.page_count(), direction_links=True,
+                on_change=lambda evt: self.show_page(evt.value - 1)
+            ).classes("print-hide")
+
+        # The browser moves the cursor itself unless the step is on
+        # another page
+        ui.on("nicesheet_goto", lambda event: self.goto(event.args))
+        self.steps_container = ui.column().classes("w-full")
+        self.show_page(None if self.page_size is None else 0)
+
+        with ui.row():
+            ui.button("Print", icon="print", on_click=self.finish).classes("print-hide")
+
+    def detach(self):
+        # The session was opened in another window, which takes it over
+        for view in self.views.values():
+            view.release()
+
+        self.views = {}
+        self.steps_container.clear()
+
+        with self.steps_container:
+            ui.label("This datasheet was opened in another window.")
+
+    def page_count(self):
+        return max(1, -(-len(self.steps) // self.page_size))
+
+    def show_page(self, page):
+        # Only the steps on the current page have UI elements; everything
+        # else lives in the steps' own state until its page is shown.
+        # A page of None shows every step.
+        if page == self.page and self.views:
+            return
+
+        self.page = page
+
+        for view in self.views.values():
+            view.release()
+
+        self.views = {}
+        self.steps_container.clear()
+
+        if page is None:
+            visible = self.steps
+        else:
+            start = page * self.page_size
+            visible = self.steps[start:start + self.page_size]
+
+        with self.steps_container:
+            for step in visible:
+                view = VIEWS[type(step)](step, self.dispatch)
+                view.to_ui()
+                self.views[step.index] = view
+
+        if self.pagination is not None and page is not None:
+            self.pagination.set_value(page + 1)
+
+    async def goto(self, index):
+        if not 0 <= index < len(self.steps):
+            return
+
+        self.current_step = index
+
+        if self.page is not None and index // self.page_size != self.page:
+            self.show_page(index // self.page_size)
+
+        await self.views[index].take_cursor()
+
+    async def on_advance(self, index):
+        await self.goto(index + 1)
+
+    async def focus_step(self, index):
+        self.current_step = index
+
+    def set_field(self, index, field, value):
+        try:
+            view = self.views[index]
+        except KeyError:
+            self.sheet.on_changed(index, field, value)
+        else:
+            view.set_field(field, value)
+
+    async def capture_all(self):
+        self.capture_all_button.props("loading")
+
+        try:
+            errors = await capture_all(self.sheet)
+        finally:
+            self.capture_all_button.props(remove="loading")
+
+        if errors:
+            ui.notify(
+                "Automatic observation failed!\n" + "\n".join(
+                    f"{self.steps[index].ref or self.steps[index].procedure}: {error}"
+                    for index, error in errors.items()
+                ),
+                type="negative",
+                multi_line=True,
+                classes="multi-line-notification",
+            )
+
+    async def finish(self):
+        await self.sheet.save_result()
+
+        # The printed datasheet needs every step, not just the current page
+        self.show_page(None)
+        self.trigger_print_dialog()
+
+    def trigger_print_dialog(self):
+        ui.run_javascript("window.print();")
+
+    def download_json(self):
+        filename = "data/" + self.sheet.filename()
+        self.sheet.write_json(filename)
+        ui.download(filename)
+
+    def save_status(self):
+        autosave = self.sheet.autosave
+
+        with ui.icon("cloud_done", size="sm") as icon:
+            tooltip = ui.tooltip().classes("multi-line-notification")
+
+        def update():
+            icon.name = "cloud_upload" if autosave.pending else "cloud_done"
+            tooltip.set_text(autosave.summary())
+
+        ui.timer(1, update)
+        return icon
+
+    def add_note(self):
+        with ui.button("Add note", icon="edit_note", on_click=self.on_click_add_note) as button:
+            self.add_note_button = button
+            ui.tooltip("Click this button, then click a step to add a note.")
+        return self.add_note_button
+
+    def on_click_add_note(self):
+        if self.add_note_requested is False:
+            self.add_note_requested = True
+            self.add_note_button.set_text("Click step")
+        else:
+            self.add_note_requested = False
+            self.add_note_button.set_text("Add note")
+
+    def on_click_step(self, index):
+        if self.add_note_requested:
+            self.views[index].add_note()
+            self.add_note_requested = False
+            self.add_note_button.set_text("Add note")
+
+    def color_choice(self):
+        def toggle_dark_mode(button):
+            if self.dark_mode.value is True:
+                self.dark_mode.disable()
+                button.props("icon=dark_mode")
+                button.set_text("Dark Mode")
+            else:
+                self.dark_mode.enable()
+                button.props("icon=light_mode")
+                button.set_text("Light Mode")
+
+        return ui.button(
+            "Dark Mode",
+            icon="light_mode" if self.dark_mode.value else "dark_mode",
+            on_click=lambda evt: toggle_dark_mode(evt.sender)
+        )
+
+    def version_info(self):
+        system_info = self.sheet.system_info
+        nicesheets_ver = system_info["dependencies"]["nicesheets"]
+        python_ver = system_info["python"]["version"]
+
+        return (f"Datasheet version: {self.sheet.version}\n"
+                f"Nicesheets version: {nicesheets_ver}\n"
+                f"Python version: {python_ver}")
@@ -0,0 +1,170 @@
+import argparse
+import json
+import sqlite3
+import sys
+from contextlib import closing
+from pathlib import Path
+from .revalidate import result_files
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sheets (
+    id INTEGER PRIMARY KEY,
+    filename TEXT UNIQUE,
+    title TEXT NOT NULL,
+    version TEXT,
+    part_number TEXT,
+    serial_number TEXT,
+    started TEXT,
+    finished TEXT
+);
+CREATE INDEX IF NOT EXISTS sheets_serial ON sheets (serial_number, finished);
+CREATE INDEX IF NOT EXISTS sheets_part ON sheets (part_number, serial_number);
+
+CREATE TABLE IF NOT EXISTS steps (
+    sheet_id INTEGER NOT NULL REFERENCES sheets (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    ref TEXT,
+    procedure TEXT,
+    value TEXT,
+    compliance TEXT,
+    note TEXT,
+    PRIMARY KEY (sheet_id, position)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS steps_ref ON steps (ref, sheet_id);
+"""
+
+
+class ResultsStore:
+    def __init__(self, filename="data/results.sqlite"):
+        self.filename = Path(filename)
+
+    def connect(self):
+        # A connection per call keeps the store usable from worker threads
+        self.filename.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self.filename)
+        connection.row_factory = sqlite3.Row
+        connection.execute("PRAGMA foreign_keys = ON")
+        connection.executescript(SCHEMA)
+        return connection
+
+    def add(self, result, filename=None):
+        with closing(self.connect()) as connection, connection:
+            return self._add(connection, result, filename)
+
+    def add_file(self, filename):
+        with open(filename, encoding="utf-8") as f:
+            return self.add(json.load(f), str(filename))
+
+    def index_files(self, paths):
+        count = 0
+
+        with closing(self.connect()) as connection, connection:
+            for path in paths:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        result = json.load(f)
+                except (OSError, ValueError) as e:
+                    print(f"{path}: {e}", file=sys.stderr)
+                    continue
+
+                self._add(connection, result, str(path))
+                count += 1
+
+        return count
+
+    def _add(self, connection, result, filename):
+        if filename is not None:
+            # Re-indexing a file replaces its previous entry
+            connection.execute("DELETE FROM sheets WHERE filename = ?", (filename,))
+
+        cursor = connection.execute(
+            "INSERT INTO sheets (filename, title, version, part_number, serial_number, "
+            "started, finished) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                filename,
+                result.get("title"),
+                result.get("version"),
+                result.get("part_number"),
+                result.get("serial_number"),
+                result.get("started"),
+                result.get("last-edit"),
+            )
+        )
+        sheet_id = cursor.lastrowid
+
+        connection.executemany(
+            "INSERT INTO steps (sheet_id, position, ref, procedure, value, compliance, note) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (sheet_id, position, step.get("ref"), step.get("procedure"),
+                 step.get("input"), step.get("compliance"), step.get("note"))
+                for position, step in enumerate(result.get("steps", []))
+            )
+        )
+        return sheet_id
+
+    def find(self, serial_number=None, part_number=None):
+        query = "SELECT * FROM sheets"
+        clauses = []
+        params = []
+
+        if serial_number is not None:
+            clauses.append("serial_number = ?")
+            params.append(serial_number)
+
+        if part_number is not None:
+            clauses.append("part_number = ?")
+            params.append(part_number)
+
+        if clauses:
+            query += " WHERE " + " AND ".join(clauses)
+
+        with closing(self.connect()) as connection:
+            return [dict(row) for row in connection.execute(query + " ORDER BY finished", params)]
+
+    def step_history(self, ref, serial_number=None):
+        query = ("SELECT sheets.serial_number, sheets.finished, sheets.filename, "
+                 "steps.value, steps.compliance, steps.note "
+                 "FROM steps JOIN sheets ON sheets.id = steps.sheet_id "
+                 "WHERE steps.ref = ?")
+        params = [ref]
+
+        if serial_number is not None:
+            query += " AND sheets.serial_number = ?"
+            params.append(serial_number)
+
+        with closing(self.connect()) as connection:
+            return [dict(row) for row in connection.execute(query + " ORDER BY sheets.finished", params)]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index and search datasheet results")
+    parser.add_argument("--db", default="data/results.sqlite")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    index = commands.add_parser("index", help="add result files to the index")
+    index.add_argument("results", nargs="*", default=["data/*.json"])
+
+    serial = commands.add_parser("serial", help="list results for a serial number")
+    serial.add_argument("serial_number")
+
+    step = commands.add_parser("step", help="list every result for a step ref")
+    step.add_argument("ref")
+    step.add_argument("--serial", default=None)
+
+    args = parser.parse_args(argv)
+    store = ResultsStore(args.db)
+
+    if args.command == "index":
+        print(f"Indexed {store.index_files(result_files(args.results))} files")
+    elif args.command == "serial":
+        for row in store.find(serial_number=args.serial_number):
+            print(f"{row['finished']}  {row['part_number']}  {row['title']} {row['version']}  {row['filename']}")
+    elif args.command == "step":
+        for row in store.step_history(args.ref, args.serial):
+            print(f"{row['finished']}  {row['serial_number']}  {row['value']}  {row['compliance']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+import argparse
+import glob
+import importlib
+import importlib.util
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from pathlib import Path
+from .model import ObservationStepData
+
+
+def load_sheet(target):
+    # target is "path/to/sheet.py", "path/to/sheet.py:name" or "module:name".
+    # Definitions should guard their call to run() with a __name__ check.
+    from .sheet import Sheet
+
+    location, _, name = target.partition(":")
+
+    if location.endswith(".py"):
+        spec = importlib.util.spec_from_file_location("nicesheet_definition", location)
+        module = importlib.util.module_from_spec(spec)
+        sys.path.insert(0, str(Path(location).parent.resolve()))
+        spec.loader.exec_module(module)
+    else:
+        module = importlib.import_module(location)
+
+    if name:
+        return getattr(module, name)
+
+    for value in vars(module).values():
+        if isinstance(value, Sheet):
+            return value
+
+    raise ValueError(f"No Sheet found in {target}")
+
+
+def spec_table(sheet):
+    return {
+        "title": sheet.title,
+        "steps": [
+            (step.index, step.ref, step.procedure, step.spec)
+            for step in sheet.steps
+            if isinstance(step, ObservationStepData) and step.spec is not None
+        ],
+    }
+
+
+def match_steps(table, result_steps):
+    # Steps are matched by position when the text still lines up, otherwise
+    # by ref and procedure text together, then by ref or procedure alone,
+    # so steps inserted into the definition since a result was recorded
+    # are still found. Refs can repeat within a sheet, so a step that could
+    # be one of several is yielded with None rather than guessed at.
+    by_both = {}
+    by_ref = {}
+    by_procedure = {}
+
+    for i, step in enumerate(result_steps):
+        ref = step.get("ref")
+        procedure = step.get("procedure")
+        by_both.setdefault((ref, procedure), []).append(i)
+
+        if ref is not None:
+            by_ref.setdefault(ref, []).append(i)
+
+        by_procedure.setdefault(procedure, []).append(i)
+
+    for row in table["steps"]:
+        index, ref, procedure, spec = row
+
+        if index < len(result_steps):
+            step = result_steps[index]
+            if step.get("ref") == ref and step.get("procedure") == procedure:
+                yield row, step
+                continue
+
+        candidates = by_both.get((ref, procedure))
+
+        if candidates is None:
+            if ref is not None:
+                candidates = by_ref.get(ref)
+            else:
+                candidates = by_procedure.get(procedure)
+
+        if not candidates:
+            continue
+        elif len(candidates) == 1:
+            yield row, result_steps[candidates[0]]
+        else:
+            yield row, None
+
+
+_table = None
+
+
+def init_worker(table):
+    global _table
+    _table = table
+
+
+def revalidate_files(paths):
+    # Gather each spec's values across the whole chunk so every spec is
+    # evaluated once per chunk with complies_many.
+    checks = {}
+    specs = {}
+    changes = []
+    errors = []
+    ambiguous = []
+    skipped = 0
+    checked = 0
+
+    for path in paths:
+        try:
+            with open(path, encoding="utf-8") as f:
+                result = json.load(f)
+        except (OSError, ValueError) as e:
+            errors.append((path, str(e)))
+            continue
+
+        if result.get("title") != _table["title"]:
+            skipped += 1
+            continue
+
+        for (index, ref, procedure, spec), step in match_steps(_table, result.get("steps", [])):
+            if step is None:
+                ambiguous.append({"file": path, "ref": ref, "procedure": procedure})
+                continue
+
+            if step.get("compliance") is None:
+                continue
+
+            specs[index] = spec
+            checks.setdefault(index, []).append((path, step))
+
+    for index, entries in checks.items():
+        verdicts = specs[index].complies_many([step.get("input") for path, step in entries])
+        checked += len(entries)
+
+        for (path, step), complies in zip(entries, verdicts):
+            verdict = "Pass" if complies else "Fail"
+
+            if verdict != step["compliance"]:
+                changes.append({
+                    "file": path,
+                    "ref": step.get("ref"),
+                    "procedure": step.get("procedure"),
+                    "input": step.get("input"),
+                    "old": step["compliance"],
+                    "new": verdict,
+                })
+
+    return {
+        "files": len(paths),
+        "skipped": skipped,
+        "checked": checked,
+        "changes": changes,
+        "errors": errors,
+        "ambiguous": ambiguous,
+    }
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def result_files(patterns):
+    for pattern in patterns:
+        for path in glob.iglob(pattern):
+            if not os.path.basename(path).startswith("tmp"):
+                yield path
+
+
+def revalidate(sheet, paths, workers=None, chunk_size=64):
+    table = spec_table(sheet)
+    workers = workers or os.cpu_count()
+    summary = {"files": 0, "skipped": 0, "checked": 0, "changes": [], "errors": [],
+               "ambiguous": []}
+    start = time.perf_counter()
+
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(table,)) as executor:
+        pending = set()
+
+        # Keep only a few chunks in flight so memory stays bounded no matter
+        # how many files there are
+        for chunk in chunked(paths, chunk_size):
+            pending.add(executor.submit(revalidate_files, chunk))
+
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                merge_results(summary, done)
+
+        merge_results(summary, pending)
+
+    summary["seconds"] = time.perf_counter() - start
+    return summary
+
+
+def merge_results(summary, futures):
+    for future in futures:
+        result = future.result()
+        summary["files"] += result["files"]
+        summary["skipped"] += result["skipped"]
+        summary["checked"] += result["checked"]
+        summary["changes"].extend(result["changes"])
+        summary["errors"].extend(result["errors"])
+        summary["ambiguous"].extend(result["ambiguous"])
+
+
+def print_summary(summary):
+    for change in summary["changes"]:
+        ref = f"({change['ref']}) " if change["ref"] else ""
+        print(f"{change['file']}: {ref}{change['procedure']}: "
+              f"{change['input']!r} {change['old']} -> {change['new']}")
+
+    for path, error in summary["errors"]:
+        print(f"{path}: {error}", file=sys.stderr)
+
+    for step in summary["ambiguous"]:
+        ref = f"({step['ref']}) " if step["ref"] else ""
+        print(f"{step['file']}: {ref}{step['procedure']}: matches more than one "
+              f"recorded step, not checked", file=sys.stderr)
+
+    rate = summary["files"] / summary["seconds"] if summary["seconds"] else 0
+    print(f"{summary['files']} files ({summary['skipped']} for other sheets), "
+          f"{summary['checked']} results checked, "
+          f"{len(summary['changes'])} changed verdicts, "
+          f"{len(summary['errors'])} errors, "
+          f"{len(summary['ambiguous'])} ambiguous steps, "
+          f"{rate:.0f} files/s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Re-check archived datasheet results against a sheet's current specs"
+    )
+    parser.add_argument("sheet", help="sheet definition, e.g. atp.py or atp.py:sheet")
+    parser.add_argument("results", nargs="*", default=["data/*.json"],
+                        help="result files or glob patterns (default: data/*.json)")
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--chunk-size", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    sheet = load_sheet(args.sheet)
+    summary = revalidate(sheet, result_files(args.results), args.workers, args.chunk_size)
+    print_summary(summary)
+    return 1 if summary["changes"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,88 @@
+import asyncio
+from graphlib import TopologicalSorter
+from .capture import capture_dependencies, run_any_capture
+from .model import ObservationStepData
+from .stats import SampleSet
+
+
+def capture_graph(steps):
+    # Maps each step to the steps it waits for. Only steps being captured
+    # are waited for; other referenced steps are read as they are.
+    indices = {step.index for step in steps}
+    return {
+        step.index: capture_dependencies(step.capture) & indices
+        for step in steps
+    }
+
+
+def record_capture(sheet, step, measurement, evaluate=True):
+    if isinstance(measurement, SampleSet):
+        step.samples = measurement
+        measurement = measurement.value
+
+    sheet.set_field(step.index, "input", str(measurement))
+
+    if evaluate:
+        sheet.set_field(step.index, "compliance", step.verdict())
+
+
+def record_failure(sheet, step, error):
+    sheet.set_field(step.index, "input", "")
+    sheet.set_field(step.index, "compliance", "Fail")
+    sheet.set_field(step.index, "note", f"Automatic observation failed: {error}")
+
+
+class DependencyFailed(Exception):
+    pass
+
+
+async def capture_all(sheet, steps=None, evaluate=True):
+    # Runs captures as soon as the steps they use are done, all at the
+    # same time. Instruments hold their own lock for each measurement, so
+    # captures on one instrument still take turns. Returns {index:
+    # exception} for captures that failed.
+    if steps is None:
+        steps = [s for s in sheet.steps if isinstance(s, ObservationStepData) and s.capture]
+
+    by_index = {step.index: step for step in steps}
+    graph = capture_graph(steps)
+    sorter = TopologicalSorter(graph)
+    sorter.prepare()
+
+    errors = {}
+    running = {}
+
+    async def run(step):
+        failed = [i for i in graph[step.index] if i in errors]
+
+        if failed:
+            raise DependencyFailed(f"step {by_index[failed[0]].ref or failed[0]} failed")
+
+        if step.index in sheet.derived:
+            # Already kept up to date as its inputs came in
+            sheet.recompute(step.index)
+            return
+
+        measurement = await run_any_capture(step.capture)
+
+        record_capture(sheet, step, measurement, evaluate)
+
+    try:
+        while sorter.is_active():
+            for index in sorter.get_ready():
+                running[asyncio.create_task(run(by_index[index]))] = index
+
+            done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                index = running.pop(task)
+
+                if task.exception() is not None:
+                    errors[index] = task.exception()
+
+                sorter.done(index)
+    finally:
+        for task in running:
+            task.cancel()
+
+    return errors
@@ -0,0 +1,98 @@
+import asyncio
+import re
+import secrets
+import sys
+from collections import OrderedDict
+from datetime import datetime
+from pathlib import Path
+from .model import ObservationStepData
+
+
+def session_memory(session):
+    # Rough size of a session's own state. The definition it shares with
+    # the sheet, like procedure text and specs, isn't counted.
+    size = sys.getsizeof(session.steps)
+
+    for step in session.steps:
+        size += sys.getsizeof(step) + sys.getsizeof(step.note)
+
+        if isinstance(step, ObservationStepData):
+            size += sys.getsizeof(step.value)
+
+            if step.samples is not None:
+                size += sys.getsizeof(step.samples.samples)
+
+    return size
+
+
+class Sessions:
+    # One session per client, kept in least recently used order. Idle
+    # sessions are saved to disk and dropped once the sessions in memory
+    # use more than memory_limit bytes, then restored when their client
+    # comes back.
+    def __init__(self, sheet, directory="data/sessions", memory_limit=64 * 2**20):
+        self.sheet = sheet
+        self.directory = Path(directory)
+        self.memory_limit = memory_limit
+        self.active = OrderedDict()
+        self.suspending = {}
+        self.eviction = None
+        self.evictions = 0
+
+    def secret(self):
+        # Signs the browser cookie that identifies each client's session,
+        # kept so clients find their sessions again after a restart
+        path = self.directory / ".secret"
+
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(secrets.token_urlsafe(32))
+
+        return path.read_text()
+
+    def path(self, session_id):
+        return self.directory / re.sub(r"[^\w-]", "_", str(session_id))
+
+    async def get(self, session_id):
+        if session_id in self.suspending:
+            # Let it finish saving before it is read back
+            await self.suspending[session_id]
+
+        session = self.active.pop(session_id, None)
+
+        if session is None:
+            session = self.sheet.new_session(self.path(session_id))
+            session.started = datetime.now().isoformat()
+            session.restore_session()
+
+        self.active[session_id] = session
+
+        if self.eviction is None or self.eviction.done():
+            # Runs once the client has taken the session, so it's not idle
+            self.eviction = asyncio.ensure_future(self.evict())
+
+        return session
+
+    def memory(self):
+        return sum(session_memory(session) for session in self.active.values())
+
+    async def evict(self):
+        sizes = {session_id: session_memory(session) for session_id, session in self.active.items()}
+        total = sum(sizes.values())
+
+        for session_id, session in list(self.active.items()):
+            if total <= self.memory_limit:
+                break
+
+            if not session.idle or self.active.get(session_id) is not session:
+                continue
+
+            del self.active[session_id]
+            total -= sizes[session_id]
+            self.evictions += 1
+            self.suspending[session_id] = asyncio.ensure_future(session.suspend())
+
+            try:
+                await self.suspending[session_id]
+            finally:
+                del self.suspending[session_id]
@@ -1,12 +1,15 @@
+import copy
 import json
+import asyncio
+from functools import partial
 from pathlib import Path
 from datetime import datetime
-from nicegui import ui
-from .step import SimpleStep, ObservationStep
+from .capture import derived_from, remap_steps, run_capture
+from .model import SimpleStepData, ObservationStepData
+from .stats import SampleSet
 from .system_info import get_system_info
-
-
-package_directory = Path(__file__).parent
+from .autosave import Autosave, write_atomic
+from .journal import Journal, load_state, sheet_header
 
 
 def extract_ref(text):
@@ -22,187 +25,259 @@ def extract_ref(text):
 class Sheet:
     def __init__(self, title, version, **kwargs):
         self.steps = []
-        self.current_step = 0
         self.instruments = []
         self.title = title
         self.version = version
+        self.settings = kwargs
+        self.results = kwargs.get("results", None)
+        self.system_info = None
+        self.part_number = None
+        self.serial_number = None
+        self.page_size = kwargs.get("page_size", None)
+        self.dependents = {}
+        self.derived = {}
+        self.init_state(kwargs.get("state_dir", "data"))
+
+    def init_state(self, state_dir):
+        # Everything that belongs to one operator's run through the sheet,
+        # apart from the step values themselves
+        self.state_dir = Path(state_dir)
+        self.started = None
+        self.page = None
+        self.derived = {index: (inputs, None) for index, (inputs, _) in self.derived.items()}
+        # Headless runs turn this off, as they only write the result file
+        self.save_state = True
+
+        if self.settings.get("journal", False):
+            self.journal = Journal(self.state_dir / "tmp.journal",
+                                   fsync=self.settings.get("journal_fsync", False),
+                                   header=self.header)
+            self.compact_every = self.settings.get("compact_every", 500)
+            save_fn = self.compact_journal
+        else:
+            self.journal = None
+            save_fn = partial(self.write_json, fsync=self.settings.get("autosave_fsync", True))
+
+        self.autosave = Autosave(save_fn, delay=self.settings.get("autosave_delay", 0.5))
+
+    def new_session(self, state_dir):
+        # A copy for one client that shares this sheet's definition but has
+        # its own step values and temporary files. Captures and identify()
+        # steps are pointed at the copy's steps.
+        session = copy.copy(self)
+        session.steps = [copy.copy(step) for step in self.steps]
+
+        for step in session.steps:
+            if isinstance(step, ObservationStepData) and step.capture is not None:
+                step.capture = remap_steps(step.capture, session.steps)
+
+        session.part_number = remap_steps(self.part_number, session.steps)
+        session.serial_number = remap_steps(self.serial_number, session.steps)
+        session.init_state(state_dir)
+        return session
+
+    @property
+    def idle(self):
+        return self.page is None or self.page.closed
+
+    async def suspend(self):
+        # Save everything to the state directory so the session can be
+        # dropped from memory and restored later
+        await self.autosave.flush()
+        await asyncio.to_thread(self.write_json)
+
+        if self.journal is not None:
+            self.journal.clear()
 
     def observe(self, text, **kwargs):
-        index = len(self.steps)
         ref, procedure = extract_ref(text)
-        step = ObservationStep(ref, procedure, {
-            "advance": self.on_advance,
-            "go_back": self.on_go_back,
-            "got_focus": lambda: self.focus_step(index),
-            "changed": self.on_changed,
-            "clicked": self.on_click_step,
-        }, **kwargs)
+        step = ObservationStepData(len(self.steps), ref, procedure, **kwargs)
         self.steps.append(step)
+
+        if step.capture is not None and step.option("derived", True):
+            inputs = sorted(derived_from(step.capture))
+
+            if inputs:
+                self.derived[step.index] = (inputs, None)
+
+                for index in inputs:
+                    self.dependents.setdefault(index, []).append(step.index)
+
         return step
     
     def do(self, text):
-        index = len(self.steps)
         ref, procedure = extract_ref(text)
-        step = SimpleStep(ref, procedure, {
-            "advance": self.on_advance,
-            "go_back": self.on_go_back,
-            "got_focus": lambda: self.focus_step(index),
-            "changed": self.on_changed,
-            "clicked": self.on_click_step,
-        })
+        step = SimpleStepData(len(self.steps), ref, procedure)
         self.steps.append(step)
         return step
-    
+
     def instrument(self, instrument):
         self.instruments.append(instrument)
 
+    def identify(self, part_number=None, serial_number=None):
+        # Steps holding the unit's part and serial numbers, recorded with
+        # the results so they can be looked up later
+        self.part_number = part_number
+        self.serial_number = serial_number
+
     def run(self):
+        from .page import serve
+
         self.system_info = get_system_info()
-        self.dark_mode = ui.dark_mode()
-        self.add_note_requested = False
-        ui.add_head_html("<style>"
-                         + open(package_directory / "style.css").read()
-                         + "</style>")
-
-        with ui.header().props("reveal").classes("items-center"):
-            with ui.row().classes("col items-baseline"):
-                ui.label(self.title).classes("text-h6")
-                with ui.label(self.version):
-                    ui.tooltip(self.version_info()).classes("multi-line-notification")
-            self.add_note().props("flat color=white dense").classes("print-hide")
-            self.color_choice().props("flat color=white dense").classes("print-hide")
-            ui.button("Print", icon="print", on_click=self.finish) \
-                .props("flat color=white dense") \
-                .classes("print-hide")
-            ui.button("Reset", icon="delete", on_click=self.reset) \
-                .props("flat color=white dense") \
-                .classes("print-hide")
-
-        for instrument in self.instruments:
-            instrument.to_ui()
-
-        with ui.row().classes("max-w-screen-lg items-center fit row no-wrap"):
-            ui.label("Ref").classes("col-1 text-h6")
-            ui.label("Procedure").classes("col text-h6")
-            ui.label("Specification").classes("col-2 text-h6")
-            ui.label("Observation").classes("col-3 text-h6")
-            ui.label("Result").classes("col-1 text-h6")
-
-        self.current_step = 0
+        serve(self)
 
-        for step in self.steps:
-            step.to_ui()
-    
-        with ui.row():
-            ui.button("Print", icon="print", on_click=self.finish).classes("print-hide")
+    def run_headless(self, inputs=None, filename=None):
+        from .headless import run_headless
+        return asyncio.run(run_headless(self, inputs, filename))
 
-        ui.run(title=self.title, favicon=package_directory / "assets/favicon.ico")
-    
-    async def on_advance(self):
-        self.current_step += 1
-        await self.steps[self.current_step].take_cursor()
+    def filename(self):
+        now = datetime.now().strftime("%Y-%m-%dT%H%M%S-%f")
 
-    async def on_go_back(self):
-        self.current_step -= 1
-        await self.steps[self.current_step].take_cursor()
+        if self.part_number is None and self.serial_number is None:
+            return now + ".json"
 
-    async def focus_step(self, index):
-        self.current_step = index
+        part_number = self.part_number.value if self.part_number else ""
+        serial_number = self.serial_number.value if self.serial_number else ""
+        return f"{part_number}_{serial_number}_{now}.json"
 
-    async def finish(self):
-        filename = "data/" + self.filename()
-        self.write_json(filename)
-        self.trigger_print_dialog()
+    async def save_result(self, filename=None):
+        if filename is None:
+            filename = "data/" + self.filename()
 
-    def trigger_print_dialog(self):
-        ui.run_javascript("window.print();")
-    
-    def on_changed(self):
-        self.write_json()
-    
-    def write_json(self, filename=None):
-        Path("data").mkdir(exist_ok=True)
+        await self.autosave.flush()
+        await asyncio.to_thread(self.write_json, filename)
 
-        if filename is None:
-            filename = "data/tmp.json"
+        if self.results is not None:
+            await asyncio.to_thread(self.results.add_file, filename)
+
+        return filename
+
+    def set_field(self, index, field, value):
+        if self.idle:
+            self.on_changed(index, field, value)
+        else:
+            self.page.set_field(index, field, value)
+
+    def on_changed(self, index, field, value):
+        if not self.steps[index].update(field, value):
+            return
+
+        if not self.save_state:
+            pass
+        elif self.journal is None:
+            self.autosave.notify()
+        else:
+            self.journal.append(index, field, value)
 
-        json.dump(self, open(filename, "w"), indent=4, cls=SheetJSONEncoder)
+            if self.journal.records >= self.compact_every and not self.journal.rotated:
+                self.journal.rotate()
+                self.autosave.notify()
 
-    def download_json(self):
-        filename = "data/" + self.filename()
-        self.write_json(filename)
-        ui.download(filename)
+        if field == "input":
+            for dependent in self.dependents.get(index, ()):
+                self.recompute(dependent)
 
-    def add_note(self):
-        with ui.button("Add note", icon="edit_note", on_click=self.on_click_add_note) as button:
-            self.add_note_button = button
-            ui.tooltip("Click this button, then click a step to add a note.")
-        return self.add_note_button
+    def recompute(self, index):
+        # Derived steps follow their inputs. The last result is kept with
+        # the input values it came from, so it is only worked out again
+        # when those values differ.
+        step = self.steps[index]
+        inputs, memo = self.derived[index]
+        key = tuple(self.steps[i].value for i in inputs)
 
-    def on_click_add_note(self):
-        if self.add_note_requested is False:
-            self.add_note_requested = True
-            self.add_note_button.set_text("Click step")
+        if memo is not None and memo[0] == key:
+            result = memo[1]
         else:
-            self.add_note_requested = False
-            self.add_note_button.set_text("Add note")
-
-    def on_click_step(self, step):
-        if self.add_note_requested:
-            step.add_note()
-            self.add_note_requested = False
-            self.add_note_button.set_text("Add note")
-
-    def color_choice(self):
-        def toggle_dark_mode(button):
-            if self.dark_mode.value is True:
-                self.dark_mode.disable()
-                button.props("icon=dark_mode")
-                button.set_text("Dark Mode")
-            else:
-                self.dark_mode.enable()
-                button.props("icon=light_mode")
-                button.set_text("Light Mode")
-
-        return ui.button(
-            "Dark Mode",
-            icon="light_mode" if self.dark_mode.value else "dark_mode",
-            on_click=lambda evt: toggle_dark_mode(evt.sender)
-        )
+            try:
+                result = run_capture(step.capture)
+            except (ValueError, TypeError, ArithmeticError):
+                # Usually an input that is empty or not a number yet
+                result = None
+
+            self.derived[index] = (inputs, (key, result))
+
+        if result is None:
+            self.set_field(index, "input", "")
+            self.set_field(index, "compliance", None)
+            return
+
+        if isinstance(result, SampleSet):
+            step.samples = result
+            result = result.value
+
+        self.set_field(index, "input", str(result))
+        self.set_field(index, "compliance", step.verdict())
+
+    def compact_journal(self):
+        self.write_json()
+        self.journal.discard_rotated()
+
+    def header(self):
+        return sheet_header(self.title, self.version, self.steps)
+
+    def restore_session(self):
+        state = load_state(self.state_dir / "tmp.json", self.journal, self.header())
+
+        for index, fields in state.items():
+            self.steps[index].restore(fields)
+
+        self.write_json()
+
+        if self.journal is not None:
+            self.journal.clear()
+    
+    def write_json(self, filename=None, fsync=True):
+        if filename is None:
+            filename = self.state_dir / "tmp.json"
+
+        Path(filename).parent.mkdir(parents=True, exist_ok=True)
+
+        text = json.dumps(self, indent=4, cls=SheetJSONEncoder)
+        write_atomic(filename, text, fsync=fsync)
 
     def reset(self):
         for step in self.steps:
-            step.reset()
+            self.set_field(step.index, "compliance", None)
+            self.set_field(step.index, "note", "")
 
-    def version_info(self):
-        nicesheets_ver = self.system_info["dependencies"]["nicesheets"]
-        python_ver = self.system_info["python"]["version"]
+            if isinstance(step, ObservationStepData):
+                self.set_field(step.index, "input", "")
 
-        return (f"Datasheet version: {self.version}\n"
-                f"Nicesheets version: {nicesheets_ver}\n"
-                f"Python version: {python_ver}")
 
 class SheetJSONEncoder(json.JSONEncoder):
     def default(self, o):
         if isinstance(o, Sheet):
             return {
                 "last-edit": datetime.now().isoformat(),
+                "started": o.started,
                 "title": o.title,
+                "version": o.version,
+                "part_number": o.part_number.value if o.part_number else None,
+                "serial_number": o.serial_number.value if o.serial_number else None,
                 "steps": o.steps,
                 "system_info": o.system_info,
+                "instruments": {
+                    instrument.name: instrument.telemetry.to_json()
+                    for instrument in o.instruments
+                },
             }
-        elif isinstance(o, SimpleStep):
+        elif isinstance(o, SimpleStepData):
             return {
                 "ref": o.ref,
                 "procedure": o.procedure,
-                "compliance": o.compliance.value,
+                "compliance": o.compliance,
                 "note": o.note,
             }
-        elif isinstance(o, ObservationStep):
-            return {
+        elif isinstance(o, ObservationStepData):
+            result = {
                 "ref": o.ref,
                 "procedure": o.procedure,
-                "input": o.input.value,
-                "compliance": o.compliance.value,
+                "input": o.value,
+                "compliance": o.compliance,
                 "note": o.note,
             }
+
+            if o.samples is not None:
+                result["samples"] = o.samples.to_json()
+
+            return result
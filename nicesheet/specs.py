@@ -1,7 +1,38 @@
 import decimal
+import operator
 from decimal import Decimal
 import re
 
+# NumPy is optional and slow to import, so it is only loaded the first
+# time complies_many() needs it
+_unloaded = object()
+numpy = _unloaded
+
+
+def load_numpy():
+    global numpy
+
+    if numpy is _unloaded:
+        try:
+            import numpy
+        except ImportError:
+            numpy = None
+
+    return numpy
+
+
+def to_decimal(value):
+    if isinstance(value, Decimal):
+        return value
+    return Decimal(str(value))
+
+
+def parse_float(value):
+    try:
+        return float(value)
+    except (ValueError, TypeError):
+        return float("nan")
+
 
 class Spec:
     def __init__(self):
@@ -10,6 +41,9 @@ class Spec:
     def complies(self, text: str):
         raise NotImplementedError
 
+    def complies_many(self, texts):
+        return [bool(self.complies(text)) for text in texts]
+
 
 class AnySpec(Spec):
     def complies(self, text: str):
@@ -19,7 +53,78 @@ class AnySpec(Spec):
         return "Any"
 
 
-class RangeSpec(Spec):
+class IntervalSpec(Spec):
+    # Numeric specs are compiled once into a comparator over an interval.
+    # A bound of None leaves that side open.
+    def __init__(self, left_bound, right_bound, left_inclusive=True, right_inclusive=True):
+        self.left_bound = left_bound
+        self.right_bound = right_bound
+        self.left_inclusive = left_inclusive
+        self.right_inclusive = right_inclusive
+        self.left_op = operator.ge if left_inclusive else operator.gt
+        self.right_op = operator.le if right_inclusive else operator.lt
+        self.check = self.compile()
+
+    def __getstate__(self):
+        # The compiled comparator is a closure, so rebuild it after pickling
+        state = self.__dict__.copy()
+        del state["check"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.check = self.compile()
+
+    def compile(self):
+        left_op, left_bound = self.left_op, self.left_bound
+        right_op, right_bound = self.right_op, self.right_bound
+
+        if left_bound is None and right_bound is None:
+            return lambda value: True
+        elif left_bound is None:
+            return lambda value: right_op(value, right_bound)
+        elif right_bound is None:
+            return lambda value: left_op(value, left_bound)
+        else:
+            return lambda value: left_op(value, left_bound) and right_op(value, right_bound)
+
+    def complies(self, text: str):
+        try:
+            value = Decimal(text)
+        except (decimal.InvalidOperation, TypeError, ValueError):
+            return False
+
+        if value.is_nan():
+            return False
+
+        return self.check(value)
+
+    def complies_many(self, texts):
+        # Vectorised with NumPy when it is installed. Values are compared as
+        # floats there, so results can differ from complies() for values
+        # closer to a bound than float precision.
+        numpy = load_numpy()
+
+        if numpy is None:
+            return super().complies_many(texts)
+
+        if isinstance(texts, numpy.ndarray) and texts.dtype.kind == "f":
+            values = texts
+        else:
+            values = numpy.fromiter((parse_float(t) for t in texts), float, count=len(texts))
+
+        result = ~numpy.isnan(values)
+
+        if self.left_bound is not None:
+            result &= self.left_op(values, float(self.left_bound))
+
+        if self.right_bound is not None:
+            result &= self.right_op(values, float(self.right_bound))
+
+        return result.tolist()
+
+
+class RangeSpec(IntervalSpec):
     def __init__(self, range_str):
         self.range_str = range_str
 
@@ -27,37 +132,87 @@ class RangeSpec(Spec):
         left = left.strip()
         right = right.strip()
 
-        self.left_inclusive = left[0] == "["
-        self.right_inclusive = right[-1] == "]"
+        super().__init__(
+            Decimal(left[1:]),
+            Decimal(right[:-1]),
+            left_inclusive=left[0] == "[",
+            right_inclusive=right[-1] == "]",
+        )
+
+    def __str__(self):
+        return self.range_str
+
+
+class ToleranceSpec(IntervalSpec):
+    def __init__(self, nominal, tolerance):
+        self.nominal = to_decimal(nominal)
+        self.tolerance = to_decimal(tolerance)
+        super().__init__(self.nominal - self.tolerance, self.nominal + self.tolerance)
+
+    def __str__(self):
+        return f"{self.nominal} ± {self.tolerance}"
+
 
-        self.left_bound = Decimal(left[1:])
-        self.right_bound = Decimal(right[:-1])
+class PercentSpec(IntervalSpec):
+    def __init__(self, nominal, percent):
+        self.nominal = to_decimal(nominal)
+        self.percent = to_decimal(percent)
+        tolerance = abs(self.nominal) * self.percent / 100
+        super().__init__(self.nominal - tolerance, self.nominal + tolerance)
+
+    def __str__(self):
+        return f"{self.nominal} ± {self.percent}%"
+
+
+class MinSpec(IntervalSpec):
+    def __init__(self, limit, inclusive=True):
+        super().__init__(to_decimal(limit), None, left_inclusive=inclusive)
+
+    def __str__(self):
+        return f"{'≥' if self.left_inclusive else '>'} {self.left_bound}"
+
+
+class MaxSpec(IntervalSpec):
+    def __init__(self, limit, inclusive=True):
+        super().__init__(None, to_decimal(limit), right_inclusive=inclusive)
+
+    def __str__(self):
+        return f"{'≤' if self.right_inclusive else '<'} {self.right_bound}"
+
+
+class EnumSpec(Spec):
+    def __init__(self, choices, case_sensitive=False):
+        self.choices = list(choices)
+        self.case_sensitive = case_sensitive
+
+        if case_sensitive:
+            self.allowed = frozenset(self.choices)
+        else:
+            self.allowed = frozenset(c.casefold() for c in self.choices)
 
     def complies(self, text: str):
-        try:
-            value = Decimal(text)
-        except (decimal.InvalidOperation, TypeError):
+        if not isinstance(text, str):
             return False
 
-        left_bound = self.left_bound
-        right_bound = self.right_bound
+        text = text.strip()
 
-        left_ok = value >= left_bound if self.left_inclusive else value > left_bound
-        right_ok = value <= right_bound if self.right_inclusive else value < right_bound
-        return left_ok and right_ok
+        if not self.case_sensitive:
+            text = text.casefold()
+
+        return text in self.allowed
 
     def __str__(self):
-        return self.range_str
+        return " / ".join(self.choices)
 
 
 class DateSpec(Spec):
+    pattern = re.compile(r"\d{2}/\d{2}/\d{4}")
+
     def __init__(self):
         pass
 
     def complies(self, text: str):
-        pattern = r"\d{2}/\d{2}/\d{4}"
-        return re.fullmatch(pattern, text)
+        return isinstance(text, str) and self.pattern.fullmatch(text) is not None
 
     def __str__(self):
         return "mm/dd/yyyy"
-    
\ No newline at end of file
@@ -0,0 +1,97 @@
+import math
+from array import array
+from decimal import Decimal
+
+
+def decimal_places(x):
+    if isinstance(x, Decimal) and x.is_finite():
+        return max(0, -x.as_tuple().exponent)
+    return 0
+
+
+class RunningStats:
+    # Welford's algorithm, so statistics are available without keeping or
+    # re-reading every sample
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, x):
+        x = float(x)
+        self.count += 1
+        delta = x - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (x - self.mean)
+        self.min = x if self.min is None else min(self.min, x)
+        self.max = x if self.max is None else max(self.max, x)
+
+    @property
+    def variance(self):
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stdev(self):
+        return math.sqrt(self.variance)
+
+
+class SampleSet(RunningStats):
+    def __init__(self):
+        super().__init__()
+        self.samples = array("d")
+        self.places = 0
+
+    def add(self, x):
+        super().add(x)
+        self.samples.append(float(x))
+        self.places = max(self.places, decimal_places(x))
+
+    @property
+    def value(self):
+        # Report the mean with one more decimal place than the readings
+        return f"{self.mean:.{self.places + 1}f}"
+
+    def to_json(self):
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "stdev": self.stdev,
+            "min": self.min,
+            "max": self.max,
+            "samples": self.samples.tolist(),
+        }
+
+
+class RingBuffer:
+    def __init__(self, size):
+        self.size = size
+        self.data = array("d", [0.0]) * size
+        self.count = 0
+        self.next = 0
+        self.places = 0
+
+    def append(self, x):
+        self.data[self.next] = float(x)
+        self.next = (self.next + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+        self.places = max(self.places, decimal_places(x))
+
+    def __len__(self):
+        return self.count
+
+    def values(self, n=None):
+        # Oldest to newest, optionally only the newest n
+        n = self.count if n is None else min(n, self.count)
+        start = (self.next - n) % self.size
+        return [self.data[(start + i) % self.size] for i in range(n)]
+
+    @property
+    def latest(self):
+        return self.data[(self.next - 1) % self.size] if self.count else None
+
+    def clear(self):
+        self.count = 0
+        self.next = 0
+        self.places = 0
@@ -1,125 +1,164 @@
+import asyncio
 import traceback
 from nicegui import ui
 from asyncio import iscoroutinefunction
 from .capture import capture_def_parts
+from .stats import SampleSet, RingBuffer
+
+
+def trend_svg(values, width=120, height=20):
+    if len(values) < 2:
+        return ""
+
+    low = min(values)
+    span = (max(values) - low) or 1
+    step = width / (len(values) - 1)
+    points = " ".join(
+        f"{i * step:.1f},{height - (v - low) / span * height:.1f}"
+        for i, v in enumerate(values)
+    )
+    return (f'<svg width="{width}" height="{height}">'
+            f'<polyline points="{points}" fill="none" stroke="currentColor"/></svg>')
 
 
 class Step:
-    def __init__(self, ref, procedure, emit):
-        self.ref = ref
-        self.procedure = procedure
-        self.emit = emit
-        self.note = ""
+    # UI for one step. Views are built when a step is shown and thrown away
+    # when it is not; the step's state lives in its StepData.
+    def __init__(self, data, dispatch):
+        self.data = data
+        self.dispatch = dispatch
         self.row_classes = "max-w-screen-lg items-center fit row no-wrap"
 
+    def emit(self, event, *args):
+        return self.dispatch(self.data.index, event, *args)
+
     def to_ui(self):
+        # Arrow and enter keys are handled in the browser by navigation.js,
+        # which finds steps by data-step
         with ui.row().classes(self.row_classes + " highlight-focus") as row:
             self.row = row
-            
-            self.ref_el = ui.label(self.ref).classes("col-1")
-            self.procedure_el = ui.markdown(self.procedure).classes("col")
+            row.props(f"data-step={self.data.index}")
+
+            self.ref_el = ui.label(self.data.ref).classes("col-1")
+            self.procedure_el = ui.markdown(self.data.procedure).classes("col")
 
             self.build_ui()
 
-            self.compliance = ui.toggle(
+            self.compliance_toggle = ui.toggle(
                 ["Pass", "Fail"],
+                value=self.data.compliance,
                 on_change=self.on_compliance_change
-            ).on("keydown", self.on_compliance_keydown).props("clearable").classes("col-1")
+            ).props("clearable").classes("col-1")
 
-        with ui.row().classes(self.row_classes + " hidden") as note_row:
+        with ui.row().classes(self.row_classes) as note_row:
             self.note_row = note_row
             ui.label().classes("col-1")
 
-            with ui.input(label="Note").props("autogrow outlined").classes("col") as input:
+            with ui.input(label="Note", value=self.data.note, on_change=self.on_note_change) \
+                    .props("autogrow outlined").classes("col") as input:
+                self.note_input = input
                 with input.add_slot("append"):
                     ui.button(icon="delete", on_click=self.delete_note).props("flat").classes("print-hide")
 
             ui.label().classes("col-1")
 
-        self.compliance.props("dense unelevated")
-        self.compliance.style("print-color-adjust: exact;")
-        self.row.on("click", lambda: self.emit["clicked"](self))
+        if self.data.note == "":
+            self.note_row.classes("hidden")
+
+        self.update_compliance_color()
+        self.compliance_toggle.props("dense unelevated")
+        self.compliance_toggle.style("print-color-adjust: exact;")
+        self.row.on("click", lambda: self.emit("clicked"))
+        self.row.on("focusin", lambda: self.emit("got_focus"))
 
     def build_ui(self):
         raise NotImplementedError
 
-    def reset(self):
-        self.compliance.set_value(None)
+    def release(self):
+        pass
+
+    def set_field(self, field, value):
+        # Setting the element fires its change handler, which reports back
+        # to the sheet. Compliance is recorded first so the handler can tell
+        # it apart from the operator's own changes.
+        if field == "compliance":
+            self.emit("changed", "compliance", value)
+            self.compliance_toggle.set_value(value)
+        elif field == "note":
+            self.note_input.set_value(value)
+
+            if value:
+                self.add_note()
 
     async def on_compliance_change(self, evt):
+        if self.compliance_toggle.value == self.data.compliance:
+            # Set by the sheet rather than the operator, so leave the
+            # cursor where it is
+            self.update_compliance_color()
+            return
+
+        self.emit("changed", "compliance", self.compliance_toggle.value)
         self.update_compliance_color()
-        self.emit["changed"]()
-        await self.emit["got_focus"]()
+        await self.emit("got_focus")
 
-        if self.compliance.value is not None:
-            await self.emit["advance"]()
+        if self.data.compliance is not None:
+            await self.emit("advance")
 
     def update_compliance_color(self, event=None):
-        if self.compliance.value == "Pass":
-            self.compliance.props("toggle-color=positive")
-        elif self.compliance.value == "Fail":
-            self.compliance.props("toggle-color=negative")
+        if self.data.compliance == "Pass":
+            self.compliance_toggle.props("toggle-color=positive")
+        elif self.data.compliance == "Fail":
+            self.compliance_toggle.props("toggle-color=negative")
         else:
-            self.compliance.props("toggle-color=primary")
-
-    async def on_compliance_keydown(self, event):
-        if event.args["keyCode"] == 37:
-            await ui.run_javascript(
-                f"getElement({self.compliance.id}).$el.firstChild.focus()",
-                respond=False
-            )
-        elif event.args["keyCode"] == 39:
-            await ui.run_javascript(
-                f"getElement({self.compliance.id}).$el.lastChild.focus()",
-                respond=False
-            )
-        elif event.args["keyCode"] == 38:
-            await self.emit["go_back"]()
-        elif event.args["keyCode"] == 40:
-            await self.emit["advance"]()            
+            self.compliance_toggle.props("toggle-color=primary")
 
     def add_note(self):
         self.note_row.classes(remove="hidden")
 
+    def on_note_change(self):
+        self.emit("changed", "note", self.note_input.value)
+
     def delete_note(self):
-        self.note = ""
+        self.note_input.set_value("")
         self.note_row.classes("hidden")
 
 
 class SimpleStep(Step):
-    def __init__(self, ref, procedure, emit):
-        super().__init__(ref, procedure, emit)
-
     def build_ui(self):
         self.input = ui.label().classes("col-3")
 
     async def take_cursor(self):
         await ui.run_javascript(
-            f"getElement({self.compliance.id}).$el.firstChild.focus()",
+            f"getElement({self.compliance_toggle.id}).$el.firstChild.focus()",
             respond=False
         )
 
 
 class ObservationStep(Step):
-    def __init__(self, ref, text, emit, **kwargs):
-        super().__init__(ref, text, emit)
-        self.unit = kwargs.get("unit", None)
-        self.observe_fn = kwargs.get("capture", None)
-        self.spec = kwargs.get("spec", None)
-        if self.spec is not None:
-            self.validate_fn = self.spec.complies
+    def __init__(self, data, dispatch):
+        super().__init__(data, dispatch)
+        self.observe_fn = data.capture
+
+        if data.spec is not None:
+            self.validate_fn = data.spec.complies
         else:
             self.validate_fn = None
-        self.min_decimal_places = kwargs.get("min_decimal_places", None)
 
-    def build_ui(self):       
-        self.spec_label = ui.label(str(self.spec)).classes("col-2")
-        
-        with ui.input(on_change=self.on_input_change) as input_field:
+        self.min_decimal_places = data.min_decimal_places
+        self.live_enabled = data.option("live", False)
+        self.live_rate = data.option("live_rate", 0.25)
+        self.live_average = data.option("live_average", None)
+        self.live_task = None
+
+    def build_ui(self):
+        self.spec_label = ui.label(str(self.data.spec)).classes("col-2")
+
+        with ui.input(value=self.data.value, on_change=self.on_input_change) as input_field:
             self.input = input_field
             self.input.props("outlined dense").classes("col-3")
 
             if self.min_decimal_places is not None:
+                self.input.props(f"data-min-places={self.min_decimal_places}")
                 self.input.on("keyup", self.warn_decimal_places,
                               throttle=1, leading_events=False)
 
@@ -129,15 +168,27 @@ class ObservationStep(Step):
                                                     on_click=self.observe)
                     self.observe_button.props("flat dense").classes("print-hide")
 
+                if self.observe_fn and self.live_enabled:
+                    self.live_button = ui.button(icon="sensors", on_click=self.toggle_live)
+                    self.live_button.props("flat dense").classes("print-hide")
+                    ui.tooltip("Watch live readings, click again to keep the value")
+
             with self.input.add_slot('append'):
-                ui.label(self.unit).style("font-size:12pt")
+                ui.label(self.data.unit).style("font-size:12pt")
 
-        self.input.on("focusin", self.emit["got_focus"])
-        self.input.on("keydown", self.on_input_keydown)
+        self.input.on("keydown.enter", self.on_input_enter)
 
-    def reset(self):
-        super().reset()
-        self.input.value = ""
+        if self.live_enabled:
+            self.live_timer = ui.timer(self.live_rate, self.update_live, active=False)
+
+    def release(self):
+        self.stop_live()
+
+    def set_field(self, field, value):
+        if field == "input":
+            self.input.set_value(value)
+        else:
+            super().set_field(field, value)
 
     async def observe(self):
         if self.observe_fn is None:
@@ -156,8 +207,13 @@ class ObservationStep(Step):
                 measurement = await capture_fn(*args, **kwargs)
             else:
                 measurement = capture_fn(*args, **kwargs)
-            
-            self.input.set_value(measurement)
+
+            if isinstance(measurement, SampleSet):
+                self.data.samples = measurement
+                measurement = measurement.value
+
+            # The step may have been paged out while the capture ran
+            self.emit("set", "input", str(measurement))
         except Exception as e:
             print(traceback.format_exc())
             ui.notify(
@@ -166,12 +222,92 @@ class ObservationStep(Step):
                 multi_line=True,
                 classes='multi-line-notification',
             )
-        
+
         self.observe_button.props(remove="loading")
-        self.input.run_method("focus")
+
+        if not self.input.is_deleted:
+            self.input.run_method("focus")
+
+    async def toggle_live(self):
+        if self.live_task is None:
+            self.start_live()
+        else:
+            await self.freeze_live()
+
+    def start_live(self):
+        self.live_buffer = RingBuffer(self.data.option("live_buffer", 100))
+        self.live_latest = None
+        self.live_error = None
+        self.live_task = asyncio.create_task(self.poll_live())
+        self.live_timer.activate()
+        self.live_button.props("color=positive")
+        self.input.props("bottom-slots")
+
+        with self.input.add_slot("hint"):
+            with ui.row().classes("items-center no-wrap") as live_row:
+                self.live_row = live_row
+                self.live_label = ui.label()
+                self.live_trend = ui.html()
+
+    def stop_live(self):
+        if self.live_task is not None:
+            self.live_task.cancel()
+            self.live_task = None
+            self.live_timer.deactivate()
+
+    async def freeze_live(self):
+        self.stop_live()
+        self.live_button.props(remove="color=positive")
+        self.input.props(remove="bottom-slots")
+        self.live_row.delete()
+
+        if len(self.live_buffer) == 0:
+            return
+
+        if self.live_average is None:
+            self.input.set_value(str(self.live_latest))
+        else:
+            samples = SampleSet()
+            for value in self.live_buffer.values(self.live_average):
+                samples.add(value)
+            samples.places = self.live_buffer.places
+            self.data.samples = samples
+            self.input.set_value(samples.value)
+
+    async def poll_live(self):
+        capture_fn, args, kwargs = capture_def_parts(self.observe_fn)
+
+        # Poll as fast as the instrument allows; the UI only picks up the
+        # buffer every live_rate seconds so the websocket isn't flooded.
+        while not self.input.is_deleted:
+            try:
+                if iscoroutinefunction(capture_fn):
+                    measurement = await capture_fn(*args, **kwargs)
+                else:
+                    measurement = capture_fn(*args, **kwargs)
+                    await asyncio.sleep(0)
+
+                self.live_buffer.append(measurement)
+                self.live_latest = measurement
+                self.live_error = None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.live_error = str(e)
+                await asyncio.sleep(self.live_rate)
+
+    def update_live(self):
+        if self.live_error is not None:
+            self.live_label.set_text(f"Error: {self.live_error}")
+        elif self.live_latest is not None:
+            values = self.live_buffer.values()
+            self.live_label.set_text(
+                f"Live: {self.live_latest} (min {min(values):g}, max {max(values):g})"
+            )
+            self.live_trend.set_content(trend_svg(values))
 
     def on_input_change(self):
-        self.emit["changed"]()
+        self.emit("changed", "input", self.input.value)
 
     def warn_decimal_places(self):
         parts = self.input.value.split(".")
@@ -191,31 +327,28 @@ class ObservationStep(Step):
                 ui.label(f"{self.min_decimal_places} or more decimal places required!")
         else:
             self.input.props(remove="color=negative bottom-slots")
-        
+
         return warn
 
     async def take_cursor(self):
         self.input.run_method("focus")
-    
-    async def on_input_keydown(self, event):
-        if event.args["keyCode"] == 38:
-            await self.emit["go_back"]()
-        elif event.args["keyCode"] == 40:
-            await self.emit["advance"]()
-        elif event.args["keyCode"] in [13, 10] and event.args["ctrlKey"]:
-            # On Chrome on Windows ctrl+enter uses keycode 10
+
+    async def on_input_enter(self, event):
+        # The browser has already moved the cursor, see navigation.js, so
+        # compliance is set the way the sheet sets it, which doesn't move
+        # the cursor again
+        if event.args["ctrlKey"]:
             await self.observe()
-        elif event.args["keyCode"] == 13 and event.args["shiftKey"]:
-            await self.emit["go_back"]()
-        elif event.args["keyCode"] == 13 and not event.args["ctrlKey"]:
+        elif not event.args["shiftKey"]:
+            if self.live_task is not None:
+                await self.freeze_live()
+
             if self.min_decimal_places is not None and self.warn_decimal_places():
-                # Don't advance if insufficient decimal places
+                # The cursor stays put until there are enough decimal places
                 return
 
             if self.validate_fn is None:
-                self.compliance.set_value("Pass")
-                await self.emit["advance"]()
+                self.set_field("compliance", "Pass")
                 return
-            
-            self.compliance.set_value("Pass" if self.validate_fn(self.input.value) else "Fail")
-            await self.emit["advance"]()
+
+            self.set_field("compliance", "Pass" if self.validate_fn(self.input.value) else "Fail")
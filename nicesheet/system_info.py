@@ -1,10 +1,14 @@
+import functools
 import platform
-from nicegui import ui
 import nicesheet
-import serial
 
 
+@functools.cache
 def get_system_info():
+    # Doesn't change while the program runs, and platform can be slow to
+    # query, so it is only worked out once
+    import serial
+
     return {
         "system": {
             "platform": platform.platform(),
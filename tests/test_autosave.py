@@ -0,0 +1,48 @@
+import asyncio
+from nicesheet.autosave import Autosave, write_atomic
+
+
+def test_write_atomic(tmp_path):
+    filename = tmp_path / "tmp.json"
+    write_atomic(filename, "first")
+    write_atomic(filename, "second", fsync=False)
+
+    assert filename.read_text() == "second"
+    assert list(tmp_path.iterdir()) == [filename]
+
+
+def test_autosave_coalesces_changes():
+    saves = []
+    autosave = Autosave(lambda: saves.append(1), delay=0.02)
+
+    async def edit():
+        for i in range(20):
+            autosave.notify()
+            await asyncio.sleep(0.001)
+
+        assert autosave.pending > 0
+        await asyncio.sleep(0.1)
+
+    asyncio.run(edit())
+    assert len(saves) == 1
+    assert autosave.stats()["pending"] == 0
+    assert autosave.stats()["saves"] == 1
+
+
+def test_autosave_flush():
+    saves = []
+    autosave = Autosave(lambda: saves.append(1), delay=10)
+
+    async def edit():
+        autosave.notify()
+        await autosave.flush()
+
+    asyncio.run(edit())
+    assert len(saves) == 1
+
+
+def test_autosave_without_loop():
+    saves = []
+    autosave = Autosave(lambda: saves.append(1))
+    autosave.notify()
+    assert len(saves) == 1
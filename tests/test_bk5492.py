@@ -0,0 +1,122 @@
+import asyncio
+import itertools
+from decimal import Decimal
+from nicesheet.instruments.bk5492 import BK5492, Function, decode_r0, is_settled
+
+
+class FakeBK5492(BK5492):
+    def __init__(self, readings):
+        super().__init__("DMM")
+        self.function = Function.Vac
+        self.readings = iter(readings)
+        self.sent = []
+        self.exchanges = 0
+        self.settle_interval = 0
+
+    def send_cmds_sync(self, cmds):
+        self.exchanges += 1
+        return [self.respond(cmd) for cmd in cmds]
+
+    def send_cmd_sync(self, cmd):
+        self.exchanges += 1
+        return self.respond(cmd)
+
+    def respond(self, cmd):
+        self.sent.append(cmd)
+
+        if cmd == "R0":
+            return f"00001S{self.function.value}0"
+        elif cmd == "S100S":
+            self.function = Function.Vdc
+            return ""
+        elif cmd == "R1":
+            return next(self.readings)
+        elif cmd == "RV":
+            return "1.02,6"
+
+
+def test_decode_r0():
+    info = decode_r0("80001F00")
+    assert info.compare_mode is True
+    assert info.relative_mode is False
+    assert info.function1 == Function.Vdc
+
+
+def test_is_settled():
+    readings = [Decimal("1.5"), Decimal("1.0"), Decimal("1.0001"), Decimal("1.0002")]
+    assert not is_settled(readings[:2], 3, Decimal("0.001"), Decimal("0"))
+    assert not is_settled(readings[:3], 3, Decimal("0.001"), Decimal("0"))
+    assert is_settled(readings, 3, Decimal("0.001"), Decimal("0"))
+    assert is_settled([Decimal("0.0001"), Decimal("-0.0001")], 2, Decimal("0.001"), Decimal("0.0005"))
+
+
+def test_function_change_settles_early():
+    meter = FakeBK5492(["9", "1.0", ">", "1.2", "1.2001", "1.2001"])
+    assert asyncio.run(meter.measure_vdc()) == Decimal("1.2001")
+    assert meter.last_settle_time < meter.change_delay
+    # The reading sent along with R0 is thrown away as the meter was on
+    # VAC, and the last settled reading is the one returned
+    assert meter.sent == ["R0", "R1", "S100S", "R1", "R1", "R1", "R1", "R1"]
+
+
+def test_settle_timeout_is_flagged():
+    meter = FakeBK5492(itertools.cycle(["1.0", "2.0"]))
+    meter.change_delay = 0.05
+    asyncio.run(meter.measure_vdc())
+    assert meter.last_settle_timed_out
+    assert meter.telemetry.to_json()["commands"]["R1"]["errors"] == {"SettleTimeout": 1}
+
+    meter = FakeBK5492(["9", "1.0", "1.2", "1.2", "1.2", "1.2"])
+    asyncio.run(meter.measure_vdc())
+    assert not meter.last_settle_timed_out
+    assert "R1" not in meter.telemetry.to_json()["commands"]
+
+
+def test_function_state_is_cached():
+    meter = FakeBK5492(["9", "1", "1", "1", "2", "3"])
+    asyncio.run(meter.measure_vdc())
+    meter.sent.clear()
+
+    assert asyncio.run(meter.measure_vdc()) == Decimal("2")
+    assert meter.sent == ["R1"]
+
+    meter.invalidate_state()
+    meter.exchanges = 0
+    assert asyncio.run(meter.measure_vdc()) == Decimal("3")
+    assert meter.sent == ["R1", "R0", "R1"]
+    assert meter.exchanges == 1
+
+
+def test_pipelined_readings_confirm_the_function():
+    meter = FakeBK5492(["9", "1", "1", "1", "1.5", "9", "0.2", "0.2", "0.2"])
+    meter.pipeline = True
+    asyncio.run(meter.measure_vdc())
+    meter.sent.clear()
+
+    assert asyncio.run(meter.measure_vdc()) == Decimal("1.5")
+    assert meter.sent == ["R0", "R1"]
+
+    # Switched back to VAC on the front panel
+    meter.function = Function.Vac
+    assert asyncio.run(meter.measure_vdc()) == Decimal("0.2")
+    assert meter.sent[2:] == ["R0", "R1", "S100S", "R1", "R1", "R1"]
+
+
+def test_version_is_cached():
+    meter = FakeBK5492([])
+    assert meter.firmware == "1.02"
+    assert meter.model == "BK5492"
+    assert meter.sent == ["RV"]
+
+    meter.test_connection()
+    assert meter.sent == ["RV", "RV"]
+
+
+def test_pipelined_exchange():
+    # loop:// echoes what is written, so each command comes back as its
+    # own response line
+    meter = BK5492("DMM", port="loop://", pipeline=True)
+    assert meter.send_cmds_sync(["RV", "R1"]) == ["RV", "R1"]
+
+    meter.pipeline = False
+    assert meter.send_cmds_sync(["RV", "R1"]) == ["RV", "R1"]
@@ -0,0 +1,122 @@
+import asyncio
+import subprocess
+import sys
+import pytest
+from decimal import Decimal
+from nicesheet.instruments.bk5492 import BK5492
+from nicesheet.instruments.broker import Broker, BrokerInstrument
+from nicesheet.instruments.instrument import InstrumentException, NoResponse
+from nicesheet.instruments.policy import ExchangePolicy
+
+
+def test_proxies_share_a_meter():
+    meter = BK5492("DMM1", port="bk5492://shared?latency=0.005&vdc=1.5&vac=0.25&noise=0")
+
+    async def main():
+        broker = Broker([meter], port=0)
+        address = await broker.start()
+        a = BrokerInstrument("DMM1", address=address)
+        b = BrokerInstrument("DMM1", address=address)
+
+        results = await asyncio.gather(a.measure_vdc(), b.measure_mvac(), a.measure_vdc())
+        assert results == [Decimal("1.5"), Decimal("250"), Decimal("1.5")]
+        assert await asyncio.to_thread(lambda: (a.model, a.firmware)) == ("BK5492", "1.02")
+
+        samples = await a.sample(a.measure_vdc, count=3)
+        assert samples.count == 3
+        assert a.telemetry.to_json()["commands"]["measure_vdc"]["count"] == 5
+
+        with pytest.raises(InstrumentException, match="no instrument 'DMM2'"):
+            await BrokerInstrument("DMM2", address=address).measure_vdc()
+
+        await broker.close()
+
+    asyncio.run(main())
+
+
+def test_errors_come_back():
+    port = "bk5492://brokenmeter?latency=0&fault_rate=1&faults=silent"
+    meter = BK5492("DMM1", port=port, policy=ExchangePolicy(timeout=0.02, retries=0))
+
+    async def main():
+        broker = Broker([meter], port=0)
+        address = await broker.start()
+
+        with pytest.raises(NoResponse, match="No response from BK5492"):
+            await BrokerInstrument("DMM1", address=address).measure_vdc()
+
+        await broker.close()
+
+        with pytest.raises(NoResponse, match="No broker"):
+            await BrokerInstrument("DMM1", address=address).measure_vdc()
+
+    asyncio.run(main())
+
+
+class SlowMeter:
+    name = "Slow"
+
+    def __init__(self):
+        self.calls = []
+
+    async def measure_label(self, label):
+        self.calls.append(label)
+        await asyncio.sleep(0.01)
+        return label
+
+
+def test_requests_are_prioritised():
+    meter = SlowMeter()
+
+    async def main():
+        broker = Broker([meter], port=0)
+        await broker.start()
+        first = broker.submit("Slow", "measure_label", ["first"])
+        await asyncio.sleep(0)
+        waiting = [
+            broker.submit("Slow", "measure_label", ["low"], priority=5),
+            broker.submit("Slow", "measure_label", ["high"], priority=-1),
+            broker.submit("Slow", "measure_label", ["normal"]),
+        ]
+        await asyncio.gather(first, *waiting)
+        await broker.close()
+
+    asyncio.run(main())
+    assert meter.calls == ["first", "high", "normal", "low"]
+
+
+def test_only_allowed_methods_are_called():
+    meter = BK5492("DMM1", port="bk5492://allowlist?latency=0")
+
+    async def main():
+        broker = Broker([meter], port=0)
+        address = await broker.start()
+        proxy = BrokerInstrument("DMM1", address=address)
+
+        assert hasattr(proxy, "measure_vdc")
+        assert not hasattr(proxy, "baud")
+        assert not hasattr(proxy, "change_to_vdc")
+
+        for method, args in [("configure", []), ("send_cmd_sync", ["*RST"]), ("baud", [])]:
+            with pytest.raises(InstrumentException, match="can't be called"):
+                await proxy.call(method, *args)
+
+        await broker.close()
+
+    asyncio.run(main())
+
+
+def test_broker_process():
+    process = subprocess.Popen(
+        [sys.executable, "-m", "nicesheet.instruments.broker", "--port", "0",
+         "DMM1=bk5492://process?latency=0&vdc=2&noise=0"],
+        stdout=subprocess.PIPE, text=True,
+    )
+
+    try:
+        host, port = process.stdout.readline().split()[-1].rsplit(":", 1)
+        meter = BrokerInstrument("DMM1", address=(host, int(port)))
+        assert meter.sync.measure_vdc() == Decimal("2")
+    finally:
+        process.terminate()
+        process.wait()
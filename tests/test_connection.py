@@ -0,0 +1,31 @@
+from nicesheet.instruments.connection import ConnectionPool
+
+
+def echo(ser, data):
+    ser.write(data)
+    return ser.read_until(b"\n")
+
+
+def test_connection_is_reused():
+    pool = ConnectionPool()
+    connection = pool.get("loop://")
+    assert pool.get("loop://") is connection
+
+    assert connection.transact(9600, 0.1, lambda ser: echo(ser, b"R0\n")) == b"R0\n"
+    assert connection.transact(19200, 0.1, lambda ser: echo(ser, b"R1\n")) == b"R1\n"
+    assert connection.opens == 1
+    assert connection.serial.baudrate == 19200
+    pool.close_all()
+
+
+def test_connection_reconnects():
+    pool = ConnectionPool()
+    connection = pool.get("loop://")
+    connection.transact(9600, 0.1, lambda ser: echo(ser, b"RV\n"))
+
+    # Simulate the adapter disappearing underneath the open port
+    connection.serial.close()
+
+    assert connection.transact(9600, 0.1, lambda ser: echo(ser, b"RV\n")) == b"RV\n"
+    assert connection.opens == 2
+    pool.close_all()
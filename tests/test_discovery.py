@@ -0,0 +1,67 @@
+import asyncio
+import threading
+from nicesheet.instruments import discovery
+from nicesheet.instruments.bk5492 import BK5492
+from nicesheet.instruments.discovery import PortWatcher, auto_bind, start_discovery
+
+
+def test_auto_bind():
+    silent = "bk5492://silent?latency=0&fault_rate=1&faults=silent"
+    found = "bk5492://found?latency=0.05"
+    ports = {"loop://": "Loopback", silent: "Silent", found: "Meter"}
+    meters = [BK5492("DMM1"), BK5492("DMM2"), BK5492("DMM3", port="bk5492://fixed")]
+
+    bound = asyncio.run(auto_bind(meters, ports))
+
+    assert bound == {meters[0]: {"model": "BK5492", "firmware": "1.02"}}
+    assert [meter.port for meter in meters] == [found, None, "bk5492://fixed"]
+
+
+class BarrierMeter(BK5492):
+    # Each probe waits until every port is being probed, so probing one
+    # port at a time breaks the barrier instead of binding
+    barrier = None
+
+    def probe(self, port):
+        self.barrier.wait()
+        return {"model": "BK5492", "firmware": port}
+
+
+def test_ports_are_probed_together():
+    ports = {f"loop://{i}": "Port" for i in range(4)}
+    BarrierMeter.barrier = threading.Barrier(len(ports), timeout=5)
+    meters = [BarrierMeter(f"DMM{i}") for i in range(2)]
+
+    bound = asyncio.run(auto_bind(meters, ports))
+
+    assert [meter.port for meter in meters] == ["loop://0", "loop://1"]
+    assert len(bound) == 2
+
+
+def test_hot_plugged_meter_is_bound(monkeypatch):
+    watcher = PortWatcher(interval=0.01)
+    scans = [{"loop://": "Loopback"}]
+    monkeypatch.setattr(discovery, "watcher", watcher)
+    monkeypatch.setattr(discovery, "scan_ports", lambda: scans[-1])
+    meter = BK5492("DMM1")
+    bound = []
+
+    async def main():
+        await start_discovery([meter], lambda *args: bound.append(args))
+        assert meter.port is None
+        version = watcher.version
+
+        scans.append({"loop://": "Loopback", "bk5492://plugged?latency=0": "Meter"})
+
+        async def plugged():
+            while not bound:
+                await asyncio.sleep(0.01)
+
+        await asyncio.wait_for(plugged(), 2)
+
+        assert watcher.version == version + 1
+        watcher.stop()
+
+    asyncio.run(main())
+    assert meter.port == "bk5492://plugged?latency=0"
+    assert bound == [(meter, {"model": "BK5492", "firmware": "1.02"})]
@@ -0,0 +1,100 @@
+import csv
+import json
+import os
+import pytest
+from nicesheet.export import export
+from nicesheet.results import ResultsStore
+
+
+def write_result(path, serial, value, mtime):
+    path.write_text(json.dumps({
+        "title": "ATP",
+        "serial_number": serial,
+        "last-edit": "2024-01-01T00:00:00",
+        "steps": [
+            {"ref": "1", "procedure": "Power on", "compliance": "Pass", "note": ""},
+            {"ref": "2", "procedure": "Measure", "input": value, "compliance": "Pass", "note": ""},
+        ],
+    }))
+    os.utime(path, (mtime, mtime))
+
+
+def read_csv(path):
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+
+def test_incremental_csv_export(tmp_path):
+    write_result(tmp_path / "a.json", "SN1", "1.1", 1000)
+    write_result(tmp_path / "b.json", "SN2", "1.2", 2000)
+    out = tmp_path / "export"
+
+    count, part = export(out, paths=tmp_path.glob("*.json"), batch_size=1)
+    assert count == 2
+    rows = read_csv(part)
+    assert [row["2"] for row in rows] == ["1.1", "1.2"]
+    assert "1" not in rows[0]
+
+    count, part = export(out, paths=tmp_path.glob("*.json"))
+    assert (count, part) == (0, None)
+
+    write_result(tmp_path / "c.json", "SN3", "1.3", 3000)
+    count, part = export(out, paths=tmp_path.glob("*.json"))
+    assert part.name == "part-00002.csv"
+    assert [row["serial_number"] for row in read_csv(part)] == ["SN3"]
+
+    count, part = export(out, paths=tmp_path.glob("*.json"), incremental=False)
+    assert count == 3
+    assert sorted(p.name for p in out.glob("part-*")) == ["part-00001.csv"]
+
+
+def test_parquet_export_from_index(tmp_path):
+    pyarrow_parquet = pytest.importorskip("pyarrow.parquet")
+
+    write_result(tmp_path / "a.json", "SN1", "1.1", 1000)
+    write_result(tmp_path / "b.json", "SN2", "1.2", 2000)
+    store = ResultsStore(tmp_path / "results.sqlite")
+    store.index_files(sorted(tmp_path.glob("*.json")))
+
+    count, part = export(tmp_path / "export", "parquet", store=store)
+    table = pyarrow_parquet.read_table(part)
+    assert count == 2
+    assert table.column("2").to_pylist() == ["1.1", "1.2"]
+    assert table.column("serial_number").to_pylist() == ["SN1", "SN2"]
+
+
+def write_repeated(path, mtime):
+    path.write_text(json.dumps({
+        "title": "ATP",
+        "steps": [
+            {"ref": "1.3.1", "procedure": "DC volts", "input": "1.5", "compliance": "Pass"},
+            {"ref": "1.3.1", "procedure": "AC volts", "input": "0.2", "compliance": "Pass"},
+        ],
+    }))
+    os.utime(path, (mtime, mtime))
+
+
+def test_repeated_refs_get_their_own_columns(tmp_path):
+    write_repeated(tmp_path / "a.json", 1000)
+    store = ResultsStore(tmp_path / "results.sqlite")
+    store.index_files([tmp_path / "a.json"])
+
+    for kwargs in [{"paths": [tmp_path / "a.json"]}, {"store": store}]:
+        _, part = export(tmp_path / "export", incremental=False, **kwargs)
+        rows = read_csv(part)
+        assert rows[0]["1.3.1"] == "1.5"
+        assert rows[0]["1.3.1#2"] == "0.2"
+
+
+def test_files_are_read_once(tmp_path, monkeypatch):
+    write_result(tmp_path / "a.json", "SN1", "1.1", 1000)
+    write_result(tmp_path / "b.json", "SN2", "1.2", 2000)
+    reads = []
+    load = json.load
+    monkeypatch.setattr(json, "load", lambda f: reads.append(f.name) or load(f))
+
+    count, part = export(tmp_path / "export", paths=tmp_path.glob("*.json"))
+    assert count == 2
+    assert len(reads) == 2
+    assert [row["2"] for row in read_csv(part)] == ["1.1", "1.2"]
+    assert not (tmp_path / "export" / ".export-spool.jsonl").exists()
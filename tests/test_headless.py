@@ -0,0 +1,99 @@
+import asyncio
+import json
+import subprocess
+import sys
+from decimal import Decimal
+from pathlib import Path
+from nicesheet.sheet import Sheet
+from nicesheet.specs import RangeSpec
+from nicesheet.stats import SampleSet
+from nicesheet.capture import get_steps_mean
+from nicesheet.headless import cycle, main
+
+
+def read_volts():
+    return "1.5"
+
+
+async def read_amps():
+    samples = SampleSet()
+    for value in [Decimal("0.1"), Decimal("0.3")]:
+        samples.add(value)
+    return samples
+
+
+def broken():
+    raise OSError("no meter")
+
+
+def build_sheet():
+    s = Sheet("ATP", "v1", autosave_delay=0)
+    s.do("(1) Power on")
+    s.observe("Operator")
+    t1 = s.observe("(2) Volts", capture=read_volts, spec=RangeSpec("[1, 2]"))
+    s.observe("(3) Amps", capture=read_amps, spec=RangeSpec("[0, 0.1]"))
+    s.observe("(4) Mean", capture=(get_steps_mean, [t1]))
+    s.observe("(5) Ohms", capture=broken)
+    return s
+
+
+def test_run_headless(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = build_sheet()
+
+    summary = s.run_headless({"1": "Pass", "Operator": "LP"}, filename=tmp_path / "out.json")
+    assert summary["passed"] == 4
+    assert summary["failed"] == 2
+    assert summary["incomplete"] == 0
+
+    result = json.loads((tmp_path / "out.json").read_text())
+    steps = result["steps"]
+    assert result["started"] is not None
+    assert steps[0]["compliance"] == "Pass"
+    assert steps[1]["input"] == "LP"
+    assert steps[2]["input"] == "1.5" and steps[2]["compliance"] == "Pass"
+    assert steps[3]["input"] == "0.20" and steps[3]["compliance"] == "Fail"
+    assert steps[3]["samples"]["count"] == 2
+    assert steps[4]["input"] == "1.500"
+    assert steps[5]["compliance"] == "Fail"
+    assert "no meter" in steps[5]["note"]
+
+
+def test_cycle_resets_units_without_saving_state(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = build_sheet()
+    s.steps[1].note = "Left over from the last unit"
+
+    results = asyncio.run(cycle(s, {"1": "Pass", "Operator": "LP"}, 2))
+    assert [result["failed"] for result in results] == [2, 2]
+    assert s.steps[1].note == ""
+    assert s.autosave.stats()["saves"] == 0
+    assert sorted(p.name for p in (tmp_path / "data").iterdir()) == sorted(
+        Path(result["filename"]).name for result in results
+    )
+
+
+def test_cli_cycles_units(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "atp.py").write_text(
+        "from nicesheet import Sheet\n"
+        "from nicesheet.specs import RangeSpec\n"
+        "s = Sheet('ATP', 'v1')\n"
+        "s.observe('(1) Volts', spec=RangeSpec('[1, 2]'))\n"
+    )
+
+    assert main(["atp.py", "-i", "1=1.5", "-n", "3"]) == 0
+    assert len(list((tmp_path / "data").glob("2*.json"))) == 3
+    assert main(["atp.py", "-i", "1=5"]) == 1
+
+
+def test_headless_does_not_import_nicegui(tmp_path):
+    code = ("import sys\n"
+            "from nicesheet import Sheet\n"
+            "from nicesheet.instruments import BK5492\n"
+            "s = Sheet('ATP', 'v1')\n"
+            "s.instrument(BK5492('DMM1', port='loop://'))\n"
+            "s.observe('(1) Volts', capture=lambda: '1')\n"
+            "s.run_headless()\n"
+            "assert 'nicegui' not in sys.modules, 'nicegui was imported'\n")
+    subprocess.run([sys.executable, "-c", code], cwd=tmp_path, check=True)
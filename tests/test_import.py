@@ -0,0 +1,49 @@
+import subprocess
+import sys
+
+
+def import_time(statement, package="nicesheet"):
+    # Total microseconds spent in the top level imports of package by
+    # statement in a fresh interpreter, from python -X importtime, along
+    # with the modules it left loaded
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         statement + "; import sys; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, check=True,
+    )
+    total = 0
+
+    for line in result.stderr.splitlines():
+        fields = line.split("|")
+
+        if len(fields) == 3 and fields[2].startswith(" " + package):
+            total += int(fields[1])
+
+    return total, set(result.stdout.split())
+
+
+def nicegui_import_time():
+    # Absolute budgets fail on a loaded machine, so import times are
+    # compared against nicegui's, measured the same way
+    total, _ = import_time("import nicegui", "nicegui")
+    return total
+
+
+def test_light_imports(record_property):
+    total, modules = import_time("import nicesheet, nicesheet.specs, nicesheet.capture")
+    nicegui = nicegui_import_time()
+    record_property("import_us", total)
+    record_property("nicegui_import_us", nicegui)
+
+    assert not {"nicegui", "numpy", "serial", "asyncio"} & modules
+    assert total < nicegui / 4
+
+
+def test_sheet_import(record_property):
+    total, modules = import_time("from nicesheet import Sheet")
+    nicegui = nicegui_import_time()
+    record_property("import_us", total)
+    record_property("nicegui_import_us", nicegui)
+
+    assert not {"nicegui", "numpy", "serial"} & modules
+    assert total < nicegui / 4
@@ -0,0 +1,81 @@
+import asyncio
+import threading
+import time
+from decimal import Decimal
+from nicesheet.instruments.instrument import Instrument
+
+
+class SlowEcho(Instrument):
+    def send_cmd_sync(self, cmd):
+        time.sleep(0.1)
+        return cmd
+
+    async def measure(self):
+        return await self.send_cmd("R1")
+
+
+class WaitingEcho(Instrument):
+    # The exchange only answers once the event loop has ticked, which it
+    # can't do if send_cmd blocks it
+    def __init__(self):
+        self.ticked = threading.Event()
+
+    def send_cmd_sync(self, cmd):
+        return cmd if self.ticked.wait(timeout=2) else None
+
+
+def test_send_cmd_does_not_block_loop():
+    instrument = WaitingEcho()
+
+    async def ticker():
+        await asyncio.sleep(0.01)
+        instrument.ticked.set()
+
+    async def main():
+        return await asyncio.gather(instrument.send_cmd("R1"), ticker())
+
+    response, _ = asyncio.run(main())
+    assert response == "R1"
+
+
+def test_sync_proxy():
+    instrument = SlowEcho()
+    assert instrument.sync.measure() == "R1"
+    assert instrument.sync.send_cmd_sync("RV") == "RV"
+
+
+def test_sample():
+    instrument = SlowEcho()
+    readings = iter(["1.0", "2.0", "3.0"])
+
+    async def measure():
+        return Decimal(next(readings))
+
+    samples = asyncio.run(instrument.sample(measure, count=3))
+    assert samples.count == 3
+    assert samples.value == "2.00"
+
+
+class LoggingMeter(Instrument):
+    def __init__(self):
+        self.log = []
+
+    async def measure(self, label):
+        async with self.lock():
+            self.log.append(label)
+            await asyncio.sleep(0.001)
+            return Decimal(1)
+
+
+def test_sample_is_not_interleaved():
+    # e.g. a live reading polling the meter during an N sample capture
+    instrument = LoggingMeter()
+
+    async def main():
+        await asyncio.gather(
+            instrument.sample(lambda: instrument.measure("sample"), count=3),
+            instrument.measure("live"),
+        )
+
+    asyncio.run(main())
+    assert instrument.log == ["sample"] * 3 + ["live"]
@@ -0,0 +1,130 @@
+import json
+from nicesheet.journal import Journal, index_map, load_state
+from nicesheet.sheet import Sheet
+
+
+def test_journal_replay(tmp_path):
+    journal = Journal(tmp_path / "tmp.journal")
+    journal.append(0, "input", "1.23")
+    journal.append(0, "compliance", "Pass")
+    journal.rotate()
+    journal.append(1, "note", "Loose connector")
+    journal.close()
+
+    assert list(journal.replay()) == [
+        (0, "input", "1.23"),
+        (0, "compliance", "Pass"),
+        (1, "note", "Loose connector"),
+    ]
+
+    journal.discard_rotated()
+    assert list(journal.replay()) == [(1, "note", "Loose connector")]
+
+
+def test_journal_ignores_torn_record(tmp_path):
+    journal = Journal(tmp_path / "tmp.journal")
+    journal.append(0, "input", "5")
+    journal.close()
+
+    with open(tmp_path / "tmp.journal", "a") as f:
+        f.write('[1, "inp')
+
+    assert list(journal.replay()) == [(0, "input", "5")]
+
+
+def test_load_state(tmp_path):
+    snapshot = {
+        "title": "ATP",
+        "steps": [
+            {"ref": "1", "procedure": "Do", "compliance": "Pass", "note": ""},
+            {"ref": "2", "procedure": "Observe", "input": "4", "compliance": None, "note": ""},
+        ],
+    }
+    (tmp_path / "tmp.json").write_text(json.dumps(snapshot))
+
+    journal = Journal(tmp_path / "tmp.journal")
+    journal.append(1, "input", "4.5")
+    journal.close()
+
+    header = {"title": "ATP", "version": "v1", "steps": [["1", "Do"], ["2", "Observe"]]}
+    state = load_state(tmp_path / "tmp.json", journal, header)
+    assert state[0]["compliance"] == "Pass"
+    assert state[1]["input"] == "4.5"
+
+    journal.header = lambda: dict(header, title="Other")
+    assert load_state(tmp_path / "tmp.json", journal, dict(header, title="Other")) == {}
+
+
+def test_index_map():
+    v1 = {"title": "ATP", "version": "v1", "steps": [["1", "Volts"], ["2", "Amps"]]}
+    v2 = {"title": "ATP", "version": "v2", "steps": [["1", "Volts"], ["1a", "Ohms"], ["2", "Amps"]]}
+    assert index_map(v1, v1) == {0: 0, 1: 1}
+    assert index_map(v1, v2) == {0: 0, 1: 2}
+    assert index_map(v1, dict(v1, title="Other")) == {}
+    assert index_map(None, v1) == {}
+
+    repeated = {"title": "ATP", "version": "v2", "steps": [["1", "Volts"], ["1", "Volts"], ["2", "Amps"]]}
+    assert index_map(v1, repeated) == {1: 2}
+
+
+def test_sheet_restores_session(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def build():
+        s = Sheet("ATP", "v1", journal=True)
+        s.system_info = {}
+        s.do("(1) Power on")
+        s.observe("(2) Measure")
+        return s
+
+    s = build()
+    s.on_changed(0, "compliance", "Pass")
+    s.on_changed(1, "input", "3.3")
+    s.journal.close()
+
+    s = build()
+    s.restore_session()
+    assert s.steps[0].compliance == "Pass"
+    assert s.steps[1].value == "3.3"
+    assert not (tmp_path / "data/tmp.journal").exists()
+
+    with open(tmp_path / "data/tmp.json") as f:
+        assert json.load(f)["steps"][1]["input"] == "3.3"
+
+
+def test_state_from_another_sheet_is_not_restored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    def build(title, version, inserted=False):
+        s = Sheet(title, version, journal=True)
+        s.system_info = {}
+        s.observe("(1) Volts")
+
+        if inserted:
+            s.observe("(1a) Ohms")
+
+        s.observe("(2) Amps")
+        return s
+
+    s = build("Other ATP", "v1")
+    s.on_changed(0, "input", "junk")
+    s.journal.close()
+
+    s = build("ATP", "v1")
+    s.restore_session()
+    assert [step.value for step in s.steps] == ["", ""]
+
+    s.on_changed(0, "input", "1.5")
+    s.on_changed(1, "input", "0.2")
+    s.journal.close()
+
+    v1 = s
+    s = build("ATP", "v2", inserted=True)
+    s.restore_session()
+    assert [step.value for step in s.steps] == ["1.5", "", "0.2"]
+
+    # The same from a snapshot written by v1
+    v1.write_json()
+    s = build("ATP", "v2", inserted=True)
+    s.restore_session()
+    assert [step.value for step in s.steps] == ["1.5", "", "0.2"]
@@ -0,0 +1,42 @@
+import json
+from nicesheet.results import ResultsStore
+from nicesheet.sheet import Sheet
+
+
+def test_results_store(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = Sheet("ATP", "v1")
+    s.system_info = {}
+    pn = s.observe("Part number")
+    sn = s.observe("Serial number")
+    step = s.observe("(2.1) Measure voltage")
+    s.identify(part_number=pn, serial_number=sn)
+
+    store = ResultsStore(tmp_path / "results.sqlite")
+
+    for serial, value in [("SN1", "1.1"), ("SN2", "1.3"), ("SN1", "1.2")]:
+        s.set_field(sn.index, "input", serial)
+        s.set_field(step.index, "input", value)
+        s.write_json(f"data/{serial}_{value}.json")
+        store.add_file(f"data/{serial}_{value}.json")
+
+    # Indexing the same file again replaces it
+    store.add_file("data/SN1_1.2.json")
+
+    runs = store.find(serial_number="SN1")
+    assert len(runs) == 2
+    assert runs[0]["part_number"] == ""
+    assert runs[0]["version"] == "v1"
+
+    history = store.step_history("2.1", serial_number="SN1")
+    assert [row["value"] for row in history] == ["1.1", "1.2"]
+    assert len(store.step_history("2.1")) == 3
+
+
+def test_index_files(tmp_path):
+    (tmp_path / "a.json").write_text(json.dumps({"title": "ATP", "serial_number": "SN9", "steps": []}))
+    (tmp_path / "b.json").write_text("not json")
+
+    store = ResultsStore(tmp_path / "results.sqlite")
+    assert store.index_files([tmp_path / "a.json", tmp_path / "b.json"]) == 1
+    assert store.find(serial_number="SN9")[0]["title"] == "ATP"
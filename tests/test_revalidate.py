@@ -0,0 +1,85 @@
+import json
+from nicesheet.revalidate import load_sheet, revalidate
+
+
+DEFINITION = """
+from nicesheet import Sheet
+from nicesheet.specs import RangeSpec
+
+s = Sheet("ATP", "v2")
+s.do("(1) Power on")
+s.observe("(1.5) New step", spec=RangeSpec("[0, 1]"))
+s.observe("(2) Measure voltage", spec=RangeSpec("[1, 2]"))
+"""
+
+
+def write_result(path, value, compliance, title="ATP"):
+    path.write_text(json.dumps({
+        "title": title,
+        "steps": [
+            {"ref": "1", "procedure": "Power on", "compliance": "Pass", "note": ""},
+            {"ref": "2", "procedure": "Measure voltage", "input": value,
+             "compliance": compliance, "note": ""},
+        ],
+    }))
+
+
+def test_revalidate(tmp_path):
+    (tmp_path / "atp.py").write_text(DEFINITION)
+    sheet = load_sheet(str(tmp_path / "atp.py"))
+
+    write_result(tmp_path / "a.json", "1.5", "Pass")
+    write_result(tmp_path / "b.json", "2.5", "Pass")
+    write_result(tmp_path / "c.json", "0.5", "Fail")
+    write_result(tmp_path / "d.json", "2.5", "Pass", title="Other")
+    (tmp_path / "e.json").write_text("{")
+    paths = sorted(str(p) for p in tmp_path.glob("*.json"))
+
+    summary = revalidate(sheet, paths, workers=2, chunk_size=2)
+    assert summary["files"] == 5
+    assert summary["skipped"] == 1
+    assert summary["checked"] == 3
+    assert len(summary["errors"]) == 1
+    assert summary["changes"] == [{
+        "file": str(tmp_path / "b.json"),
+        "ref": "2",
+        "procedure": "Measure voltage",
+        "input": "2.5",
+        "old": "Pass",
+        "new": "Fail",
+    }]
+
+
+REPEATED_REFS = """
+from nicesheet import Sheet
+from nicesheet.specs import RangeSpec
+
+s = Sheet("ATP", "v2")
+s.observe("(0) New step", spec=RangeSpec("[0, 1]"))
+s.observe("(1) DC volts", spec=RangeSpec("[1, 2]"))
+s.observe("(1) AC volts", spec=RangeSpec("[5, 6]"))
+s.observe("(2) Renamed", spec=RangeSpec("[0, 1]"))
+"""
+
+
+def test_repeated_refs(tmp_path):
+    (tmp_path / "atp.py").write_text(REPEATED_REFS)
+    sheet = load_sheet(str(tmp_path / "atp.py"))
+    (tmp_path / "a.json").write_text(json.dumps({
+        "title": "ATP",
+        "steps": [
+            {"ref": "1", "procedure": "DC volts", "input": "1.5", "compliance": "Pass"},
+            {"ref": "1", "procedure": "AC volts", "input": "5.5", "compliance": "Pass"},
+            {"ref": "2", "procedure": "Ohms", "input": "0.5", "compliance": "Pass"},
+            {"ref": "2", "procedure": "Amps", "input": "0.5", "compliance": "Pass"},
+        ],
+    }))
+
+    summary = revalidate(sheet, [str(tmp_path / "a.json")], workers=1)
+    # Each (1) step is checked against its own reading
+    assert summary["checked"] == 2
+    assert summary["changes"] == []
+    # The renamed (2) step could be either recorded one
+    assert summary["ambiguous"] == [
+        {"file": str(tmp_path / "a.json"), "ref": "2", "procedure": "Renamed"},
+    ]
@@ -0,0 +1,90 @@
+import asyncio
+import pytest
+from graphlib import CycleError
+from nicesheet.sheet import Sheet
+from nicesheet.specs import RangeSpec
+from nicesheet.capture import get_steps_mean
+from nicesheet.instruments.instrument import Instrument
+from nicesheet.schedule import capture_all, capture_dependencies
+
+
+class FakeMeter(Instrument):
+    def __init__(self, name, value, events=None):
+        self.name = name
+        self.port = None
+        self.value = value
+        self.events = [] if events is None else events
+
+    async def measure(self):
+        async with self.lock():
+            self.events.append(("start", self.name))
+            await asyncio.sleep(0.01)
+            self.events.append(("end", self.name))
+            return self.value
+
+    async def fail(self):
+        raise OSError("no response")
+
+
+def build_sheet(events=None, mean=get_steps_mean):
+    s = Sheet("ATP", "v1", autosave_delay=0)
+    m1 = FakeMeter("DMM1", "1.0", events)
+    m2 = FakeMeter("DMM2", "2.0", events)
+    t1 = s.observe("(1) A", capture=m1.measure)
+    t2 = s.observe("(2) B", capture=m1.measure)
+    t3 = s.observe("(3) C", capture=m2.measure)
+    s.observe("(4) Mean", capture=(mean, [t1, t2, t3]), spec=RangeSpec("[1, 2]"))
+    return s, m1, m2
+
+
+def test_dependencies():
+    s, m1, m2 = build_sheet()
+    assert capture_dependencies(s.steps[3].capture) == {0, 1, 2}
+    assert capture_dependencies(s.steps[0].capture) == set()
+
+
+def test_capture_all(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    events = []
+
+    async def logged_mean(steps):
+        events.append(("start", "Mean"))
+        return get_steps_mean(steps)
+
+    s, m1, m2 = build_sheet(events, logged_mean)
+
+    errors = asyncio.run(capture_all(s))
+
+    assert errors == {}
+    assert [step.value for step in s.steps] == ["1.0", "1.0", "2.0", "1.333"]
+    assert s.steps[3].compliance == "Pass"
+    # DMM1's two captures run one after the other while DMM2 runs alongside
+    dmm1 = [event for event, name in events if name == "DMM1"]
+    assert dmm1 == ["start", "end", "start", "end"]
+    assert events.index(("start", "DMM2")) < events.index(("end", "DMM1"))
+    # The mean waits for all of its inputs
+    assert events[-1] == ("start", "Mean")
+
+
+def test_failed_capture_skips_dependents(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = Sheet("ATP", "v1", autosave_delay=0)
+    meter = FakeMeter("DMM1", "1.0")
+    t1 = s.observe("(1) A", capture=meter.fail)
+    t2 = s.observe("(2) B", capture=meter.measure)
+    s.observe("(3) Mean", capture=(get_steps_mean, [t1, t2]))
+
+    errors = asyncio.run(capture_all(s))
+    assert set(errors) == {0, 2}
+    assert s.steps[1].value == "1.0"
+    assert "step 1 failed" in str(errors[2])
+
+
+def test_cycle_is_rejected():
+    s = Sheet("ATP", "v1")
+    t1 = s.observe("(1) A")
+    t2 = s.observe("(2) B", capture=(get_steps_mean, [t1]))
+    t1.capture = (get_steps_mean, [t2])
+
+    with pytest.raises(CycleError):
+        asyncio.run(capture_all(s))
@@ -0,0 +1,63 @@
+import asyncio
+import re
+from nicesheet.sheet import Sheet
+from nicesheet.capture import get_steps_mean
+from nicesheet.session import Sessions, session_memory
+
+
+def build_sheet(**kwargs):
+    s = Sheet("ATP", "v1", autosave_delay=0, **kwargs)
+    t1 = s.observe("(1) A")
+    t2 = s.observe("(2) B")
+    s.observe("(3) Mean", capture=(get_steps_mean, [t1, t2]))
+    s.identify(serial_number=t1)
+    return s
+
+
+def test_sessions_are_isolated(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = build_sheet()
+    a = s.new_session(tmp_path / "a")
+    b = s.new_session(tmp_path / "b")
+
+    a.set_field(0, "input", "1")
+    a.set_field(1, "input", "2")
+    b.set_field(0, "input", "5")
+
+    assert [step.value for step in a.steps] == ["1", "2", "1.500"]
+    assert [step.value for step in b.steps] == ["5", "", ""]
+    assert [step.value for step in s.steps] == ["", "", ""]
+
+    # Definitions are shared, state is not
+    assert a.steps[0].procedure is s.steps[0].procedure
+    assert a.serial_number is a.steps[0]
+    assert a.filename().startswith("_1_")
+    assert re.fullmatch(r"_1_\d{4}-\d\d-\d\dT\d{6}-\d{6}\.json", a.filename())
+
+    a.identify()
+    assert re.fullmatch(r"\d{4}-\d\d-\d\dT\d{6}-\d{6}\.json", a.filename())
+    assert (tmp_path / "a" / "tmp.json").exists()
+
+
+def test_idle_sessions_are_evicted_and_restored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = build_sheet(journal=True)
+
+    async def main():
+        sessions = Sessions(s, tmp_path / "sessions", memory_limit=0)
+        a = await sessions.get("a")
+        a.set_field(0, "input", "1")
+        a.set_field(0, "note", "checked")
+        assert session_memory(a) > 0
+
+        await sessions.get("b")
+        await sessions.eviction
+        assert "a" not in sessions.active
+        assert sessions.evictions >= 1
+
+        restored = await sessions.get("a")
+        assert restored is not a
+        assert restored.steps[0].value == "1"
+        assert restored.steps[0].note == "checked"
+
+    asyncio.run(main())
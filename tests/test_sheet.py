@@ -1,6 +1,79 @@
-from nicesheet.sheet import extract_ref
+import tracemalloc
+from nicesheet.sheet import Sheet, extract_ref
+from nicesheet.specs import RangeSpec
 
 
 def test_extract_ref():
     assert (None, "Test text") == extract_ref("Test text")
-    assert ("1.4.2", "Test text") == extract_ref("(1.4.2) Test text")
\ No newline at end of file
+    assert ("1.4.2", "Test text") == extract_ref("(1.4.2) Test text")
+
+def test_steps_keep_state_without_ui(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = Sheet("ATP", "v1", page_size=1)
+    s.system_info = {}
+    s.do("(1) Power on")
+    step = s.observe("(2) Measure")
+
+    s.set_field(step.index, "input", "1.5")
+    s.set_field(step.index, "compliance", "Pass")
+    assert step.value == "1.5"
+    assert step.compliance == "Pass"
+
+    s.reset()
+    assert step.value == ""
+    assert step.compliance is None
+
+
+def test_step_memory_footprint():
+    # 10k step sheet definitions should stay well under 0.5 kB per step,
+    # including the step text itself
+    spec = RangeSpec("[0, 1]")
+    tracemalloc.start()
+    s = Sheet("ATP", "v1")
+    before = tracemalloc.get_traced_memory()[0]
+
+    for i in range(10000):
+        if i % 2:
+            s.observe(f"({i}) Measure test point {i}", unit="V", spec=spec)
+        else:
+            s.do(f"({i}) Set switch {i} to ON")
+
+    per_step = (tracemalloc.get_traced_memory()[0] - before) / 10000
+    tracemalloc.stop()
+
+    assert per_step < 512
+
+
+def test_derived_steps_follow_inputs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    calls = []
+
+    def total(steps):
+        calls.append(1)
+        return sum(int(step.value) for step in steps)
+
+    s = Sheet("ATP", "v1", autosave_delay=0)
+    s.system_info = {}
+    t1 = s.observe("(1) A")
+    t2 = s.observe("(2) B")
+    derived = s.observe("(3) Total", capture=(total, [t1, t2]), spec=RangeSpec("[0, 5]"))
+    manual = s.observe("(4) Total", capture=(total, [t1, t2]), derived=False)
+
+    s.set_field(t1.index, "input", "1")
+    assert derived.value == ""
+    assert derived.compliance is None
+
+    s.set_field(t2.index, "input", "2")
+    assert derived.value == "3"
+    assert derived.compliance == "Pass"
+
+    s.set_field(t2.index, "input", "9")
+    assert derived.value == "10"
+    assert derived.compliance == "Fail"
+    assert manual.value == ""
+
+    # Unchanged inputs reuse the last result
+    count = len(calls)
+    s.set_field(t2.index, "input", "9")
+    s.recompute(derived.index)
+    assert len(calls) == count
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import time
+import pytest
+import serial
+from decimal import Decimal
+from nicesheet.instruments.bk5492 import BK5492, Function
+from nicesheet.instruments.instrument import BadResponse, InstrumentException, NoResponse
+from nicesheet.instruments.policy import ExchangePolicy
+from nicesheet.instruments.simulator import simulators
+from nicesheet.sheet import Sheet
+
+
+def test_simulated_port():
+    ser = serial.serial_for_url("bk5492://port?latency=0", timeout=0.1)
+    ser.write(b"RV\r\nR0\r\n")
+    assert ser.read_until(b"\r\n") == b"1.02,6\r\n"
+    assert ser.read_until(b"\r\n") == b"00001S00\r\n"
+    assert ser.read_until(b"\r\n") == b""
+
+
+def test_measurements():
+    meter = BK5492("DMM", port="bk5492://measure?latency=0.001&vdc=1.5&vac=0.25&noise=0")
+    assert meter.model == "BK5492"
+    assert asyncio.run(meter.measure_vdc()) == Decimal("1.5")
+    assert asyncio.run(meter.measure_mvac()) == Decimal("250")
+    assert simulators["measure"].function == Function.Vac
+
+
+def test_function_switch_settles():
+    meter = BK5492("DMM", port="bk5492://switch?latency=0.001&switch_delay=0.3&noise=0.00001&seed=1")
+    meter.settle_interval = 0.05
+    assert asyncio.run(meter.measure_vac()) == pytest.approx(Decimal("0.5"), abs=Decimal("0.001"))
+    assert 0.3 <= meter.last_settle_time < meter.change_delay
+
+
+def test_concurrent_measurements_dont_interleave():
+    # e.g. a live VAC reading running while Capture all reads a VDC step
+    meter = BK5492("DMM", port="bk5492://shared_meter?latency=0.001&vdc=1.5&vac=0.25&noise=0")
+    meter.settle_interval = 0.001
+    meter.change_delay = 0.01
+
+    async def main():
+        return await asyncio.gather(*(
+            meter.measure_vdc() if i % 2 else meter.measure_vac() for i in range(10)
+        ))
+
+    assert asyncio.run(main()) == [Decimal("0.25"), Decimal("1.5")] * 5
+
+
+def test_fault_injection():
+    policy = ExchangePolicy(timeout=0.05, backoff=0)
+    meter = BK5492("DMM", port="bk5492://silent?latency=0&fault_rate=1&faults=silent", policy=policy)
+    with pytest.raises(NoResponse):
+        asyncio.run(meter.measure_vdc())
+
+    for fault in ["blank", "bad"]:
+        meter = BK5492("DMM", port=f"bk5492://{fault}?latency=0&fault_rate=1&faults={fault}", policy=policy)
+        with pytest.raises(BadResponse):
+            asyncio.run(meter.measure_vdc())
+
+        assert meter.telemetry.to_json()["commands"]["R0"]["errors"] == {"BadResponse": policy.retries + 1}
+
+
+def test_flaky_meter_is_retried():
+    port = "bk5492://flaky?latency=0.001&fault_rate=0.2&seed=2&noise=0"
+    meter = BK5492("DMM", port=port, policy=ExchangePolicy(timeout=0.05, retries=4, backoff=0.001))
+
+    for _ in range(20):
+        meter.invalidate_state()
+        assert asyncio.run(meter.measure_vdc()) == Decimal("1")
+
+    assert meter.telemetry.to_json()["commands"]["R1"]["retries"] > 0
+
+
+def test_timeout_follows_reply_time():
+    policy = ExchangePolicy(timeout=1, min_timeout=0.01)
+    meter = BK5492("DMM", port="bk5492://quick?latency=0.005", policy=policy)
+    assert policy.timeout == 1
+
+    for _ in range(10):
+        meter.send_cmd_sync("R1")
+
+    assert policy.timeout < 0.1
+
+    policy.timed_out()
+    assert policy.timeout == 1
+    assert policy.backoff_delay(0) < policy.backoff_delay(1) <= policy.max_backoff
+
+
+def reading_latency(meter, count=5):
+    start = time.perf_counter()
+
+    for _ in range(count):
+        meter.invalidate_state()
+        asyncio.run(meter.measure_vdc())
+
+    return (time.perf_counter() - start) / count
+
+
+def test_pipelining_benchmark():
+    # Timing dependent: compares wall-clock averages, but the 20 ms
+    # per-write delay saved by pipelining leaves a wide margin
+    port = "bk5492://bench?latency=0.005&link_delay=0.02"
+    pipelined = BK5492("DMM", port=port, pipeline=True)
+    sequential = BK5492("DMM", port=port)
+
+    assert reading_latency(pipelined) < reading_latency(sequential)
+
+
+def test_telemetry():
+    policy = ExchangePolicy(timeout=0.1, retries=1, backoff=0)
+    meter = BK5492("DMM", port="bk5492://telemetry?latency=0.01&noise=0", policy=policy)
+    asyncio.run(meter.measure_vdc())
+    asyncio.run(meter.read_value())
+
+    stats = meter.telemetry.to_json()["commands"]
+    assert stats["R0"]["count"] == 1
+    assert stats["R1"]["count"] == 2
+    assert stats["R1"]["bytes_sent"] == 8
+    assert stats["R1"]["bytes_received"] == 2 * len(b"1.00000\r\n")
+    assert stats["R1"]["mean_ms"] >= 10
+    assert sum(stats["R1"]["histogram"].values()) == 2
+
+    simulators["telemetry"].configure({"fault_rate": "1", "faults": "silent"})
+    with pytest.raises(NoResponse):
+        asyncio.run(meter.read_value())
+    stats = meter.telemetry.to_json()["commands"]["R1"]
+    assert stats["errors"] == {"NoResponse": 2}
+    assert stats["retries"] == 1
+
+    simulators["telemetry"].configure({"faults": "bad"})
+    meter.invalidate_state()
+    with pytest.raises(InstrumentException):
+        asyncio.run(meter.measure_vdc())
+    assert meter.telemetry.to_json()["commands"]["R0"]["errors"] == {"BadResponse": 2}
+
+
+def test_telemetry_in_result(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    s = Sheet("ATP", "v1", autosave_delay=0)
+    meter = BK5492("DMM", port="bk5492://result?latency=0&noise=0")
+    s.instrument(meter)
+    s.observe("(1) Volts", capture=meter.measure_vdc)
+
+    s.run_headless(filename=tmp_path / "out.json")
+    result = json.loads((tmp_path / "out.json").read_text())
+    assert result["instruments"]["DMM"]["commands"]["R1"]["count"] == 1
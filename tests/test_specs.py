@@ -1,4 +1,5 @@
-from nicesheet.specs import RangeSpec
+from nicesheet import specs
+from nicesheet.specs import RangeSpec, ToleranceSpec, PercentSpec, MinSpec, MaxSpec, EnumSpec
 
 
 def test_range_spec():
@@ -25,4 +26,49 @@ def test_range_spec_unexpected_input():
     s = RangeSpec("[1, 2]")
     assert s.complies("") == False
     assert s.complies(None) == False
-    assert s.complies("abc") == False
\ No newline at end of file
+    assert s.complies("abc") == False
+
+def test_range_spec_many(monkeypatch):
+    values = ["0.99", "1", "2.5", "2.51", "", None, "abc", "nan"]
+    expected = [False, True, True, False, False, False, False, False]
+    s = RangeSpec("[1, 2.5]")
+
+    assert s.complies_many(values) == expected
+
+    monkeypatch.setattr(specs, "numpy", None)
+    assert s.complies_many(values) == expected
+
+
+def test_tolerance_specs():
+    s = ToleranceSpec("5.00", "0.10")
+    assert str(s) == "5.00 ± 0.10"
+    assert s.complies("4.90") == True
+    assert s.complies("5.11") == False
+
+    s = PercentSpec(-10, 5)
+    assert str(s) == "-10 ± 5%"
+    assert s.complies("-10.5") == True
+    assert s.complies("-9.4") == False
+
+
+def test_one_sided_specs():
+    s = MinSpec("4.5")
+    assert str(s) == "≥ 4.5"
+    assert s.complies("4.5") == True
+    assert s.complies("1e6") == True
+    assert s.complies("4.49") == False
+
+    s = MaxSpec(2, inclusive=False)
+    assert str(s) == "< 2"
+    assert s.complies("-1e6") == True
+    assert s.complies("2") == False
+    assert s.complies_many(["1", "2", "x"]) == [True, False, False]
+
+
+def test_enum_spec():
+    s = EnumSpec(["Red", "Green"])
+    assert str(s) == "Red / Green"
+    assert s.complies(" red") == True
+    assert s.complies("Blue") == False
+    assert s.complies(None) == False
+    assert EnumSpec(["Red"], case_sensitive=True).complies("red") == False
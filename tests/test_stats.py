@@ -0,0 +1,43 @@
+import statistics
+from decimal import Decimal
+from nicesheet.stats import RunningStats, SampleSet, RingBuffer
+
+
+def test_running_stats():
+    values = [1.2, 1.5, 0.9, 1.1, 1.3]
+    stats = RunningStats()
+
+    for value in values:
+        stats.add(value)
+
+    assert stats.count == 5
+    assert abs(stats.mean - statistics.mean(values)) < 1e-12
+    assert abs(stats.stdev - statistics.stdev(values)) < 1e-12
+    assert stats.min == 0.9
+    assert stats.max == 1.5
+
+
+def test_sample_set():
+    samples = SampleSet()
+
+    for value in ["1.23", "1.24", "1.24"]:
+        samples.add(Decimal(value))
+
+    assert samples.value == "1.237"
+    assert samples.to_json()["count"] == 3
+    assert samples.to_json()["samples"] == [1.23, 1.24, 1.24]
+
+
+def test_ring_buffer():
+    ring = RingBuffer(3)
+    assert ring.latest is None
+    assert ring.values() == []
+
+    for value in ["1", "2", "3", "4.5"]:
+        ring.append(Decimal(value))
+
+    assert len(ring) == 3
+    assert ring.values() == [2.0, 3.0, 4.5]
+    assert ring.values(2) == [3.0, 4.5]
+    assert ring.latest == 4.5
+    assert ring.places == 1